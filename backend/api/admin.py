@@ -0,0 +1,77 @@
+import io
+import pstats
+
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import ProfileCapture
+
+PROFILE_STATS_LINES = 40
+
+
+class ProfileCaptureAdmin(admin.ModelAdmin):
+    list_display = (
+        'created_at', 'method', 'path', 'status', 'duration_ms', 'user',
+        'download_link',
+    )
+    list_filter = ('method', 'status')
+    list_select_related = ('user', )
+    search_fields = ('path', )
+    fields = (
+        'created_at', 'user', 'method', 'path', 'status', 'duration_ms',
+        'download_link', 'stats',
+    )
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='api_profilecapture_download',
+            ),
+            *super().get_urls(),
+        ]
+
+    def download_view(self, request, pk):
+        capture = get_object_or_404(ProfileCapture, pk=pk)
+        if not self.has_view_permission(request, capture):
+            raise PermissionDenied
+        if not capture.file_path.exists():
+            raise Http404('Файл профиля удален')
+        return FileResponse(
+            capture.file_path.open('rb'),
+            as_attachment=True,
+            filename=capture.file_name,
+        )
+
+    @admin.display(description='Файл')
+    def download_link(self, obj):
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse('admin:api_profilecapture_download', args=(obj.pk, )),
+            obj.file_name,
+        )
+
+    @admin.display(description='Самые долгие функции')
+    def stats(self, obj):
+        """Начало отчета pstats, отсортированного по общему времени."""
+        if not obj.file_path.exists():
+            return 'Файл профиля удален'
+        output = io.StringIO()
+        pstats.Stats(str(obj.file_path), stream=output).sort_stats(
+            'cumulative').print_stats(PROFILE_STATS_LINES)
+        return format_html('<pre>{}</pre>', output.getvalue())
+
+
+admin.site.register(ProfileCapture, ProfileCaptureAdmin)
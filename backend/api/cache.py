@@ -0,0 +1,183 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.http.response import HttpResponseBase
+
+from .metrics import count_cache
+
+CATALOG = 'catalog'
+USERS = 'users'
+RECIPES = 'recipes'
+
+
+def get_version(name):
+    """Возвращает текущую версию набора данных name."""
+    return cache.get_or_set(
+        f'version:{name}', lambda: uuid4().hex, timeout=None)
+
+
+def bump_version(name):
+    """Меняет версию, после чего старые записи кэша не используются."""
+    cache.set(f'version:{name}', uuid4().hex, timeout=None)
+
+
+def get_versions(names):
+    """Версии нескольких наборов данных за одно обращение к кэшу."""
+    keys = {name: f'version:{name}' for name in names}
+    found = cache.get_many(keys.values())
+    missing = {
+        key: uuid4().hex for key in keys.values() if key not in found}
+    cache.set_many(missing, timeout=None)
+    found.update(missing)
+    return {name: found[key] for name, key in keys.items()}
+
+
+def get_author_version_name(author_id):
+    return f'{USERS}:{author_id}'
+
+
+def make_key(*parts):
+    return hashlib.md5(
+        ':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def get_recipe_cache_keys(recipes, request):
+    """Ключи кэша представлений рецептов.
+
+    Ключ меняется при изменении рецепта, его ингредиентов и тегов
+    (updated_at, см. api.signals.touch_recipes), при изменении
+    справочников и профиля автора; адрес сайта входит в ключ, так как
+    ссылка на картинку абсолютная.
+    """
+    versions = (
+        get_version(CATALOG),
+        request.build_absolute_uri('/') if request else '',
+    )
+    authors = get_versions({
+        get_author_version_name(recipe.author_id) for recipe in recipes})
+    return {
+        recipe.pk: make_key(
+            'recipe', recipe.pk, recipe.updated_at.isoformat(),
+            authors[get_author_version_name(recipe.author_id)], *versions)
+        for recipe in recipes
+    }
+
+
+def render_response(view, request, response):
+    """Рендерит ответ DRF и возвращает его тело и Content-Type."""
+    response.accepted_renderer = request.accepted_renderer
+    response.accepted_media_type = request.accepted_media_type
+    response.renderer_context = view.get_renderer_context()
+    response.render()
+    return response.content, response['Content-Type']
+
+
+class CatalogCacheMixin:
+    """Кэширует отрендеренные ответы справочников.
+
+    Ключ кэша и ETag строятся из версии справочника, запрошенного
+    формата и полного пути запроса. Версия меняется сигналами при
+    изменении тегов и ингредиентов.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.accepted_renderer.format == 'api':
+            return handler(request, *args, **kwargs)
+        key = make_key(
+            CATALOG, get_version(CATALOG),
+            request.accepted_media_type, request.get_full_path())
+        etag = f'"{key}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        cached = cache.get(key)
+        count_cache('catalog', cached is not None)
+        if cached is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            cached = render_response(self, request, response)
+            cache.set(key, cached, timeout=settings.CATALOG_CACHE_TIMEOUT)
+        else:
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        return response
+
+
+class AnonymousFeedCacheMixin:
+    """Кэширует страницы списка рецептов для анонимных пользователей.
+
+    Ключ строится из нормализованной строки запроса, а в записи хранятся
+    версии рецептов, справочников и пользователей, с которыми она
+    собрана. Устаревшую запись пересобирает только тот процесс, который
+    захватил блокировку; остальные до этого отдают прежнюю версию.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if (request.user.is_authenticated
+                or request.accepted_renderer.format == 'api'):
+            return super().list(request, *args, **kwargs)
+        query = urlencode(sorted(
+            (param, sorted(values))
+            for param, values in request.query_params.lists()
+        ), doseq=True)
+        key = make_key(
+            RECIPES, request.build_absolute_uri(request.path),
+            request.accepted_media_type, query)
+        versions = (
+            get_version(RECIPES), get_version(CATALOG), get_version(USERS))
+        entry = cache.get(key)
+        count_cache(
+            'feed', entry is not None and entry[0] == versions)
+        if entry is None or entry[0] != versions:
+            entry = self.rebuild_feed_page(
+                key, versions, entry, request, *args, **kwargs)
+        if isinstance(entry, HttpResponseBase):
+            return entry
+        _, content, content_type = entry
+        return HttpResponse(content, content_type=content_type)
+
+    def rebuild_feed_page(self, key, versions, stale, request,
+                          *args, **kwargs):
+        lock, token = f'{key}:lock', uuid4().hex
+        locked = cache.add(
+            lock, token, timeout=settings.FEED_CACHE_LOCK_TIMEOUT)
+        if not locked:
+            if stale is not None:
+                return stale
+            deadline = time.monotonic() + settings.FEED_CACHE_LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = cache.get(key)
+                if entry is not None and entry[0] == versions:
+                    return entry
+        # Не дождавшийся процесс собирает страницу только для себя:
+        # запись в кэше и блокировка принадлежат ее владельцу.
+        try:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            entry = (versions, *render_response(self, request, response))
+            if locked:
+                cache.set(key, entry, timeout=settings.FEED_CACHE_TIMEOUT)
+            return entry
+        finally:
+            # После FEED_CACHE_LOCK_TIMEOUT блокировку мог взять другой
+            # процесс, ее удаляет только тот, чей токен в ней лежит.
+            if locked and cache.get(lock) == token:
+                cache.delete(lock)
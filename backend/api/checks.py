@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache', )
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """Кэш в памяти процесса не видит смены версий из других процессов."""
+    if settings.DEBUG or settings.CACHES['default']['BACKEND'] not in (
+            LOCAL_CACHES):
+        return []
+    return [Warning(
+        'Кэш хранится в памяти процесса: версии, измененные другими '
+        'процессами gunicorn и командами manage.py, не сбрасывают его.',
+        hint='Укажите общий кэш в CACHE_BACKEND, например FileBasedCache.',
+        id='api.W001',
+    )]
@@ -1,6 +1,6 @@
 from django_filters.rest_framework import (AllValuesMultipleFilter,
                                            BooleanFilter, CharFilter,
-                                           FilterSet)
+                                           ChoiceFilter, FilterSet)
 from recipes.models import Ingredient, Recipe
 
 
@@ -10,13 +10,24 @@ class RecipeFilter(FilterSet):
         field_name='tags__slug')
     is_in_shopping_cart = BooleanFilter(method='filter_is_in_shopping_cart')
     is_favorited = BooleanFilter(method='filter_is_favorited')
+    ordering = ChoiceFilter(
+        choices=(
+            ('-created_at', 'Сначала новые'),
+            ('-favorites_count', 'Сначала популярные'),
+        ),
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
         fields = (
-            'author', 'is_in_shopping_cart', 'tags', 'is_favorited'
+            'author', 'is_in_shopping_cart', 'tags', 'is_favorited',
+            'ordering'
         )
 
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(value, '-created_at', '-id')
+
     def filter_is_in_shopping_cart(self, queryset, value, name):
         if value and self.request.user.is_authenticated:
             return queryset.filter(
@@ -0,0 +1,148 @@
+import json
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from recipes.models import Ingredient, Recipe
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[max(int(len(values) * share) - 1, 0)]
+
+
+class Command(BaseCommand):
+    """Замеряет основные эндпоинты API через тестовый клиент Django.
+
+    Для каждого эндпоинта выводит p50 и p95 задержки, число запросов к
+    базе и размер ответа в JSON, чтобы прогоны можно было сравнивать.
+    Данные для замеров создает generate_fake_data.
+    """
+
+    # python manage.py benchmark_endpoints --requests 100 > before.json
+
+    help = 'Замеряет задержку, число запросов и размер ответов API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=50,
+            help='количество замеров на эндпоинт',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=5,
+            help='количество запросов без замера перед каждым эндпоинтом',
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='очищать кэш перед каждым запросом',
+        )
+        parser.add_argument(
+            '--file_name',
+            type=str,
+            default=None,
+            help='файл для результатов, по умолчанию stdout',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        user = User.objects.annotate(
+            follows=Count('following')
+        ).order_by('-follows', 'pk').first()
+        recipes = list(Recipe.objects.order_by('?').values_list(
+            'pk', flat=True)[:1000])
+        names = list(Ingredient.objects.order_by('?').values_list(
+            'name', flat=True)[:1000])
+        if user is None or not recipes or not names:
+            raise CommandError(
+                'Нет данных для замеров, запустите generate_fake_data.')
+        anonymous = Client()
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        endpoints = {
+            'recipes': (anonymous, lambda: '/api/recipes/?limit=6'),
+            'recipes_auth': (client, lambda: '/api/recipes/?limit=6'),
+            'recipe': (
+                client,
+                lambda: f'/api/recipes/{self.random.choice(recipes)}/'),
+            'subscriptions': (
+                client,
+                lambda: '/api/users/subscriptions/?limit=6&recipes_limit=3'),
+            'ingredients_name': (
+                client,
+                lambda: '/api/ingredients/?name={}'.format(
+                    self.random.choice(names)[:self.random.randint(1, 3)])),
+            'download_shopping_cart': (
+                client, lambda: '/api/recipes/download_shopping_cart/'),
+        }
+        with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            results = {
+                name: self.measure(client, url, options)
+                for name, (client, url) in endpoints.items()
+            }
+        output = json.dumps({
+            'database': connection.vendor,
+            'cache': settings.CACHES['default']['BACKEND'],
+            'users': User.objects.count(),
+            'recipes': Recipe.objects.count(),
+            'cold': options['cold'],
+            'requests': options['requests'],
+            'endpoints': results,
+        }, ensure_ascii=False, indent=2)
+        if options['file_name']:
+            with open(options['file_name'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+    def measure(self, client, url, options):
+        for _ in range(options['warmup']):
+            self.request(client, url())
+        timings, queries, sizes, statuses = [], [], [], set()
+        for _ in range(options['requests']):
+            if options['cold']:
+                cache.clear()
+            path = url()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response, size = self.request(client, path)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context))
+            sizes.append(size)
+            statuses.add(response.status_code)
+        return {
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'max_ms': round(max(timings), 3),
+            'queries_mean': round(statistics.mean(queries), 2),
+            'queries_max': max(queries),
+            'bytes_mean': round(statistics.mean(sizes)),
+            'statuses': sorted(statuses),
+        }
+
+    def request(self, client, path):
+        response = client.get(path)
+        if response.streaming:
+            return response, len(b''.join(response.streaming_content))
+        return response, len(response.content)
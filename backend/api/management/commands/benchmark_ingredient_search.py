@@ -0,0 +1,158 @@
+import csv
+import random
+import statistics
+import time
+
+from api.search import IngredientIndex, search_ingredients
+from api.serializers import IngredientSerilizer
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipes.models import Ingredient
+
+SYLLABLES = (
+    'ба', 'ва', 'го', 'да', 'ке', 'ли', 'мо', 'ну', 'па', 'ро', 'са',
+    'ти', 'фу', 'хе', 'цо', 'ча', 'шу', 'ще', 'ю', 'я', 'ар', 'ок',
+)
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+# Целевые p95 в микросекундах на полном справочнике из csv.
+TARGETS = {
+    'префикс, индекс': 100,
+    'нечеткий поиск': 5000,
+}
+
+
+class Command(BaseCommand):
+    """Сравнивает поиск ингредиентов по префиксу: индекс и ORM."""
+
+    # python manage.py benchmark_ingredient_search --synthetic 1000000
+
+    help = (
+        'Замеряет поиск ингредиентов по префиксу через индекс в памяти и '
+        'через ORM. Все изменения базы откатываются, запускать на '
+        'тестовой базе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file_name',
+            type=str,
+            default='static/data/ingredients.csv',
+            help='файл со справочником ингредиентов',
+        )
+        parser.add_argument(
+            '--synthetic',
+            type=int,
+            default=1000000,
+            help='размер синтетического справочника, 0 - не создавать',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=200,
+            help='количество запросов на каждый замер',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='завершиться с ошибкой, если цели по задержке не выполнены',
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        with open(options['file_name'], encoding='utf-8') as csv_file:
+            catalogs = [('csv', [
+                (row['name'], row['measurement_unit'])
+                for row in csv.DictReader(csv_file)
+            ])]
+        if options['synthetic']:
+            catalogs.append(
+                ('synthetic', self.synthetic(options['synthetic'])))
+        with transaction.atomic():
+            results = {
+                label: self.benchmark(label, rows, options['queries'])
+                for label, rows in catalogs
+            }
+            transaction.set_rollback(True)
+        failed = [
+            f'{label}: p95 {results["csv"][label]:.0f} > {target} мкс'
+            for label, target in TARGETS.items()
+            if results['csv'][label] > target
+        ]
+        for message in failed:
+            self.stderr.write(f'Цель не выполнена - {message}')
+        if failed and options['check']:
+            raise CommandError('Цели по задержке поиска не выполнены')
+
+    def synthetic(self, size):
+        names = set()
+        while len(names) < size:
+            names.add(' '.join(
+                ''.join(random.choices(SYLLABLES, k=random.randint(2, 4)))
+                for _ in range(random.randint(1, 3))
+            ))
+        return [(name, random.choice(UNITS)) for name in sorted(names)]
+
+    def misspell(self, name):
+        word = random.choice(name.split())
+        if len(word) > 3:
+            position = random.randrange(len(word))
+            word = word[:position] + word[position + 1:]
+        return word
+
+    def benchmark(self, label, rows, queries):
+        Ingredient.objects.all().delete()
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=unit)
+             for name, unit in rows),
+            batch_size=10000,
+        )
+        prefixes = [
+            name[:random.randint(1, 4)]
+            for name, _ in random.choices(rows, k=queries)
+        ]
+        started = time.perf_counter()
+        index = IngredientIndex.from_database()
+        build = time.perf_counter() - started
+        self.stdout.write(
+            f'{label}: {len(index)} ингредиентов, '
+            f'сборка индекса {build * 1000:.1f} мс')
+        misspelled = [
+            self.misspell(name) for name, _ in random.choices(rows, k=queries)
+        ]
+        fuzzy = search_ingredients
+        if connection.vendor != 'postgresql':
+            started = time.perf_counter()
+            index.trigrams
+            build = time.perf_counter() - started
+            self.stdout.write(f'  сборка триграмм {build * 1000:.1f} мс')
+            fuzzy = index.search
+        return {
+            'префикс, индекс': self.report(
+                'префикс, индекс', prefixes, index.startswith),
+            'префикс, ORM': self.report(
+                'префикс, ORM', prefixes,
+                lambda prefix: IngredientSerilizer(
+                    Ingredient.objects.filter(name__startswith=prefix),
+                    many=True).data),
+            'нечеткий поиск': self.report(
+                'нечеткий поиск', misspelled, fuzzy),
+        }
+
+    def report(self, label, queries, search):
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            search(query)
+            timings.append((time.perf_counter() - started) * 1000000)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f'  {label}: p50 {statistics.median(timings):.0f} мкс, '
+            f'p95 {p95:.0f} мкс, max {timings[-1]:.0f} мкс'
+        )
+        return p95
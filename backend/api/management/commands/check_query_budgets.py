@@ -0,0 +1,261 @@
+import base64
+import io
+import tempfile
+
+from api.urls import router_v1
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from recipes.models import (Favorites, Ingredient, Recipe, ShoppingList,
+                            ShoppingListTotal, Tag)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Follow
+
+User = get_user_model()
+IMAGE = 'data:image/png;base64,' + base64.b64encode(base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAC'
+    'hwGA60e6kgAAAABJRU5ErkJggg=='
+)).decode()
+# Наборы данных: пользователи и рецепты, добавляемые к предыдущему набору.
+DATA_SIZES = ((20, 60), (80, 600))
+# Размер страницы и длина списка id в пачечных запросах.
+PAGE_SIZES = (2, 12)
+# Маршруты, которые дополнительно вызываются без авторизации.
+ANONYMOUS_ROUTES = (('recipe-list', 'get', 'anonymous'), )
+# Ожидаемый статус ответа и допустимое число запросов к базе на холодном
+# кэше для каждого маршрута router_v1 и метода. Меняется осознанно вместе
+# с кодом эндпоинта. Бюджет None - число запросов только выводится:
+# удаление пользователя каскадно удаляет его рецепты пачками, и запросов
+# тем больше, чем их больше. Эндпоинты djoser для активации и сброса
+# вызываются без тела и должны отвечать 400.
+BUDGETS = {
+    ('api-root', 'get'): (200, 1),
+    ('customuser-list', 'get'): (200, 4),
+    ('customuser-list', 'post'): (201, 6),
+    ('customuser-activation', 'post'): (400, 1),
+    ('customuser-me', 'get'): (200, 2),
+    ('customuser-me', 'put'): (200, 5),
+    ('customuser-me', 'patch'): (200, 5),
+    ('customuser-me', 'delete'): (204, None),
+    ('customuser-resend-activation', 'post'): (400, 1),
+    ('customuser-reset-password', 'post'): (400, 1),
+    ('customuser-reset-password-confirm', 'post'): (400, 1),
+    ('customuser-reset-username', 'post'): (400, 1),
+    ('customuser-reset-username-confirm', 'post'): (400, 1),
+    ('customuser-set-password', 'post'): (204, 2),
+    ('customuser-set-username', 'post'): (400, 1),
+    ('customuser-subscriptions', 'get'): (200, 5),
+    ('customuser-detail', 'get'): (200, 3),
+    ('customuser-detail', 'put'): (200, 6),
+    ('customuser-detail', 'patch'): (200, 6),
+    ('customuser-detail', 'delete'): (204, None),
+    ('customuser-subscribe', 'post'): (201, 10),
+    ('customuser-subscribe', 'delete'): (204, 6),
+    ('recipe-list', 'get'): (200, 7),
+    ('recipe-list', 'post'): (201, 22),
+    ('recipe-download-shopping-cart', 'get'): (200, 1),
+    ('recipe-favorite-bulk', 'post'): (200, 6),
+    ('recipe-favorite-bulk', 'delete'): (200, 6),
+    ('recipe-shopping-cart-bulk', 'post'): (200, 12),
+    ('recipe-shopping-cart-bulk', 'delete'): (200, 12),
+    ('recipe-detail', 'get'): (200, 6),
+    ('recipe-detail', 'put'): (200, 35),
+    ('recipe-detail', 'patch'): (200, 35),
+    ('recipe-detail', 'delete'): (204, 22),
+    ('recipe-favorite', 'post'): (201, 7),
+    ('recipe-favorite', 'delete'): (204, 6),
+    ('recipe-shopping-cart', 'post'): (201, 13),
+    ('recipe-shopping-cart', 'delete'): (204, 12),
+    ('ingredients-list', 'get'): (200, 2),
+    ('ingredients-detail', 'get'): (200, 2),
+    ('tag-list', 'get'): (200, 2),
+    ('tag-detail', 'get'): (200, 2),
+    ('recipe-list', 'get', 'anonymous'): (200, 5),
+}
+
+
+class Command(BaseCommand):
+    """Проверяет число запросов к базе у всех маршрутов router_v1.
+
+    Каждый маршрут вызывается на двух объемах данных и с двумя размерами
+    страницы. Число запросов не должно расти с объемом и превышать
+    бюджет из BUDGETS. Все изменения базы откатываются.
+    """
+
+    # python manage.py check_query_budgets
+
+    help = 'Проверяет, что число запросов эндпоинтов API не растет'
+
+    def handle(self, *args, **options):
+        routes = self.get_routes()
+        problems = [
+            f'{self.describe(route)}: нет бюджета в BUDGETS'
+            for route in routes if route not in BUDGETS
+        ] + [
+            f'{self.describe(route)}: маршрута нет в router_v1'
+            for route in BUDGETS if route not in routes
+        ]
+        counts = {route: [] for route in routes}
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            MEDIA_ROOT=tempfile.mkdtemp(),
+        ), transaction.atomic():
+            for number, (users, recipes) in enumerate(DATA_SIZES):
+                call_command(
+                    'generate_fake_data', users=users, recipes=recipes,
+                    prefix=f'budget{number}_', seed=number,
+                    stdout=io.StringIO(),
+                )
+                context = self.prepare()
+                for page_size in PAGE_SIZES:
+                    for route in routes:
+                        counts[route].append(
+                            self.measure(route, context, page_size))
+            transaction.set_rollback(True)
+        for route, results in counts.items():
+            status, budget = BUDGETS.get(route, (None, None))
+            statuses = sorted({result_status for result_status, _ in results})
+            measured = [queries for _, queries in results]
+            line = (
+                f'{self.describe(route)}: статус {status}, бюджет {budget}, '
+                f'запросы {measured}'
+            )
+            if statuses != [status]:
+                problems.append(f'{line} - получены статусы {statuses}')
+            elif budget is not None and len(set(measured)) > 1:
+                problems.append(f'{line} - растет с данными или страницей')
+            elif budget is not None and max(measured) > budget:
+                problems.append(f'{line} - превышен бюджет')
+            elif options['verbosity'] > 1:
+                self.stdout.write(line)
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError('Бюджеты запросов не выполнены')
+        self.stdout.write(f'Проверено маршрутов: {len(routes)}')
+
+    def get_routes(self):
+        routes = []
+        for pattern in router_v1.urls:
+            if 'format' in pattern.pattern.regex.groupindex:
+                continue
+            methods = getattr(pattern.callback, 'actions', {'get': None})
+            routes.extend((pattern.name, method) for method in methods)
+        return routes + list(ANONYMOUS_ROUTES)
+
+    def describe(self, route):
+        name, method, *anonymous = route
+        return ' '.join((name, method.upper(), *anonymous))
+
+    def prepare(self):
+        """Выбирает пользователя и объекты, с которыми работают запросы."""
+        user = User.objects.annotate(
+            total=Count('recipes')).order_by('-total', 'pk').first()
+        others = list(User.objects.exclude(pk=user.pk).order_by('pk')[:2])
+        Follow.objects.filter(user=user, following__in=others).delete()
+        Follow.objects.create(user=user, following=others[0])
+        recipes = list(Recipe.objects.exclude(
+            author=user).order_by('pk').values_list('pk', flat=True))
+        for model in (Favorites, ShoppingList):
+            model.objects.filter(user=user, recipe__in=recipes[:2]).delete()
+            model.objects.add(user, recipes[2:12])
+        ShoppingListTotal.objects.reconcile([user.pk])
+        call_command('reconcile_counters', stdout=io.StringIO())
+        user.set_password('budget-password')
+        user.save(update_fields=['password'])
+        token, _ = Token.objects.get_or_create(user=user)
+        return {
+            'user': user,
+            'token': token.key,
+            'followed': others[0].pk,
+            'not_followed': others[1].pk,
+            'own_recipe': user.recipes.order_by('pk').first().pk,
+            'recipe_in': recipes[2],
+            'recipe_out': recipes[0],
+            'recipes_in': recipes[2:12],
+            'recipes_out': recipes[:2] + recipes[12:],
+            'tags': list(Tag.objects.values_list('pk', flat=True)[:2]),
+            'ingredients': list(
+                Ingredient.objects.values_list('pk', flat=True)[:3]),
+        }
+
+    def recipe_data(self, context):
+        return {
+            'name': 'Проверка бюджета', 'text': 'Текст',
+            'cooking_time': 10, 'image': IMAGE,
+            'tags': context['tags'],
+            'ingredients': [
+                {'id': pk, 'amount': 10} for pk in context['ingredients']],
+        }
+
+    def build(self, name, method, context, page_size):
+        """Путь и тело запроса для маршрута."""
+        user = context['user']
+        add = method == 'post'
+        kwargs, data, query = {}, None, ''
+        if name in ('customuser-detail', ):
+            kwargs = {'id': user.pk}
+        elif name == 'customuser-subscribe':
+            kwargs = {
+                'id': context['not_followed' if add else 'followed']}
+        elif name == 'recipe-detail':
+            kwargs = {'pk': context['own_recipe']}
+        elif name in ('recipe-favorite', 'recipe-shopping-cart'):
+            kwargs = {'pk': context['recipe_out' if add else 'recipe_in']}
+        elif name in ('ingredients-detail', ):
+            kwargs = {'pk': context['ingredients'][0]}
+        elif name in ('tag-detail', ):
+            kwargs = {'pk': context['tags'][0]}
+        if name in ('customuser-list', 'recipe-list') and not add:
+            query = f'?limit={page_size}'
+        elif name == 'customuser-subscriptions':
+            query = f'?limit={page_size}&recipes_limit=3'
+        elif name == 'ingredients-list':
+            query = '?name=а'
+        if name in ('recipe-favorite-bulk', 'recipe-shopping-cart-bulk'):
+            data = {'recipes': context[
+                'recipes_out' if add else 'recipes_in'][:page_size]}
+        elif name in ('recipe-detail', 'recipe-list') and method != 'get':
+            data = self.recipe_data(context)
+        elif name == 'customuser-list':
+            data = {
+                'email': 'budget@example.com', 'username': 'budget',
+                'first_name': 'Имя', 'last_name': 'Фамилия',
+                'password': 'budget-password-1',
+            }
+        elif name in ('customuser-me', 'customuser-detail'):
+            data = {
+                'email': user.email, 'username': user.username,
+                'first_name': 'Имя', 'last_name': 'Фамилия',
+                'current_password': 'budget-password',
+            }
+        elif name == 'customuser-set-password':
+            data = {
+                'current_password': 'budget-password',
+                'new_password': 'budget-password-2',
+            }
+        return reverse(name, kwargs=kwargs) + query, data
+
+    def measure(self, route, context, page_size):
+        """Статус ответа и число запросов к базе."""
+        name, method, *anonymous = route
+        path, data = self.build(name, method, context, page_size)
+        client = APIClient()
+        if not anonymous:
+            client.credentials(
+                HTTP_AUTHORIZATION=f'Token {context["token"]}')
+        cache.clear()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                response = getattr(client, method)(
+                    path, data, format='json')
+            transaction.set_rollback(True)
+        return response.status_code, len(queries)
@@ -0,0 +1,222 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from uuid import uuid4
+
+from django.conf import settings
+
+REQUESTS = 'foodgram_requests_total'
+DURATION = 'foodgram_request_duration_seconds'
+QUERIES = 'foodgram_request_queries'
+CACHE = 'foodgram_cache_requests_total'
+CONNECTIONS = 'foodgram_db_connections_total'
+CACHE_HIT_RATIO = 'foodgram_cache_hit_ratio'
+CONNECTION_REUSE_RATIO = 'foodgram_db_connection_reuse_ratio'
+
+HISTOGRAMS = {
+    DURATION: (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    QUERIES: (1, 2, 3, 5, 10, 20, 50, 100),
+}
+METRICS = {
+    REQUESTS: (
+        'counter', 'Запросы по представлению, действию, методу и статусу'),
+    DURATION: ('histogram', 'Время обработки запроса в секундах'),
+    QUERIES: ('histogram', 'Число запросов к базе за один запрос'),
+    CACHE: ('counter', 'Обращения к кэшу: попадания и промахи'),
+    CONNECTIONS: (
+        'counter', 'Запросы, открывшие новое соединение с базой или '
+                   'использовавшие открытое'),
+    CACHE_HIT_RATIO: ('gauge', 'Доля попаданий в кэш'),
+    CONNECTION_REUSE_RATIO: (
+        'gauge', 'Доля запросов, использовавших открытое соединение'),
+}
+
+
+def labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return f'{{{pairs}}}'
+
+
+def get_ratios(counters, name, group, label, positive):
+    """Доля счетчиков name с label == positive по группам меток group."""
+    totals = defaultdict(lambda: [0, 0])
+    for (metric, labels), value in counters.items():
+        if metric != name:
+            continue
+        labels = dict(labels)
+        total = totals[tuple((key, labels[key]) for key in group)]
+        total[0] += value if labels[label] == positive else 0
+        total[1] += value
+    return [
+        (labels, part / total)
+        for labels, (part, total) in sorted(totals.items()) if total
+    ]
+
+
+class Registry:
+    """Метрики процесса.
+
+    Каждый процесс gunicorn копит метрики в памяти и не чаще раза в
+    METRICS_FLUSH_INTERVAL секунд записывает их в свой файл в METRICS_DIR.
+    При выгрузке файлы всех процессов складываются, поэтому метрики
+    завершившихся процессов тоже учитываются. Файлы, которые не
+    обновлялись дольше METRICS_RETENTION секунд, при выгрузке удаляются.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pid = os.getpid()
+        self.file_name = f'{self.pid}-{uuid4().hex}.json'
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed = time.monotonic()
+
+    def check_process(self):
+        # После fork у дочернего процесса должен быть свой файл.
+        if self.pid != os.getpid():
+            self.reset()
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            self.check_process()
+            self.counters[name, labels_key(labels)] += value
+
+    def observe(self, name, value, **labels):
+        buckets = HISTOGRAMS[name]
+        with self.lock:
+            self.check_process()
+            counts, total = self.histograms.get(
+                (name, labels_key(labels)), ([0] * (len(buckets) + 1), 0))
+            index = next(
+                (index for index, bound in enumerate(buckets)
+                 if value <= bound),
+                len(buckets),
+            )
+            counts[index] += 1
+            self.histograms[name, labels_key(labels)] = (
+                counts, total + value)
+
+    def flush(self, force=False):
+        """Записывает метрики процесса в его файл."""
+        now = time.monotonic()
+        if not force and now - self.flushed < settings.METRICS_FLUSH_INTERVAL:
+            return
+        with self.lock:
+            self.check_process()
+            if not self.counters and not self.histograms:
+                return
+            self.flushed = now
+            data = json.dumps({
+                'counters': [
+                    [name, labels, value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [name, labels, counts, total]
+                    for (name, labels), (counts, total)
+                    in self.histograms.items()
+                ],
+            })
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        temporary = directory / f'{self.file_name}.tmp'
+        temporary.write_text(data)
+        os.replace(temporary, directory / self.file_name)
+
+    def collect(self):
+        """Складывает метрики из файлов всех процессов."""
+        self.flush(force=True)
+        counters = defaultdict(float)
+        histograms = {}
+        expired = time.time() - settings.METRICS_RETENTION
+        for path in Path(settings.METRICS_DIR).glob('*.json'):
+            try:
+                if path.stat().st_mtime < expired:
+                    path.unlink()
+                    continue
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in data['counters']:
+                counters[name, labels_key(dict(labels))] += value
+            for name, labels, counts, total in data['histograms']:
+                key = (name, labels_key(dict(labels)))
+                if len(counts) != len(HISTOGRAMS.get(name, ())) + 1:
+                    continue
+                saved_counts, saved_total = histograms.get(
+                    key, ([0] * len(counts), 0))
+                histograms[key] = (
+                    [saved + count
+                     for saved, count in zip(saved_counts, counts)],
+                    saved_total + total,
+                )
+        return counters, histograms
+
+    def export(self):
+        """Метрики всех процессов в текстовом формате Prometheus."""
+        counters, histograms = self.collect()
+        samples = defaultdict(list)
+        for (name, labels), value in sorted(counters.items()):
+            samples[name].append((name, labels, value))
+        for (name, labels), (counts, total) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip((*HISTOGRAMS[name], '+Inf'), counts):
+                cumulative += count
+                samples[name].append((
+                    f'{name}_bucket', (*labels, ('le', str(bound))),
+                    cumulative))
+            samples[name].append((f'{name}_sum', labels, total))
+            samples[name].append((f'{name}_count', labels, cumulative))
+        samples[CACHE_HIT_RATIO] = [
+            (CACHE_HIT_RATIO, labels, value) for labels, value in
+            get_ratios(counters, CACHE, ('cache', ), 'result', 'hit')
+        ]
+        samples[CONNECTION_REUSE_RATIO] = [
+            (CONNECTION_REUSE_RATIO, labels, value) for labels, value in
+            get_ratios(counters, CONNECTIONS, (), 'state', 'reused')
+        ]
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            if not samples[name]:
+                continue
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(
+                f'{sample}{format_labels(labels)} {float(value)!r}'
+                for sample, labels, value in samples[name]
+            )
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+@atexit.register
+def flush_at_exit():
+    if settings.METRICS:
+        registry.flush(force=True)
+
+
+def count_cache(name, hits, total=1):
+    """Учитывает обращение к кэшу name: hits попаданий из total."""
+    if not settings.METRICS:
+        return
+    registry.inc(CACHE, hits, cache=name, result='hit')
+    registry.inc(CACHE, total - hits, cache=name, result='miss')
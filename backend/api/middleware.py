@@ -0,0 +1,282 @@
+import cProfile
+import heapq
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+from pathlib import Path
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.serializers import BaseSerializer
+from rest_framework.settings import api_settings
+
+from .metrics import CONNECTIONS, DURATION, QUERIES, REQUESTS, registry
+from .models import ProfileCapture
+
+logger = logging.getLogger('api.timing')
+current_timing = ContextVar('current_timing', default=None)
+
+
+class RequestTiming:
+    """Замеры одного запроса.
+
+    view - время представления вместе с сериализацией и SQL, serialize -
+    обращения к serializer.data внутри представления, включая SQL
+    отложенных выборок, render - преобразование данных ответа в JSON или
+    другой формат.
+    """
+
+    def __init__(self, slowest):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql = 0.0
+        self.serialize = 0.0
+        self.serializing = False
+        self.view_started = None
+        self.render_started = None
+        self.view = 0.0
+        self.render = 0.0
+        self.total = 0.0
+        self.slowest = []
+        self.slowest_size = slowest
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обертка connection.execute_wrapper, работает и без DEBUG."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.sql += duration
+            if self.slowest_size:
+                statement = (duration, self.queries, sql)
+                if len(self.slowest) < self.slowest_size:
+                    heapq.heappush(self.slowest, statement)
+                else:
+                    heapq.heappushpop(self.slowest, statement)
+
+    def rendered(self, response):
+        self.render = time.perf_counter() - self.render_started
+
+    def finish(self):
+        finished = time.perf_counter()
+        self.total = finished - self.started
+        if self.view_started is not None:
+            self.view = (self.render_started or finished) - self.view_started
+
+    def as_dict(self):
+        return {
+            'queries': self.queries,
+            'sql_ms': round(self.sql * 1000, 2),
+            'serialize_ms': round(self.serialize * 1000, 2),
+            'view_ms': round(self.view * 1000, 2),
+            'render_ms': round(self.render * 1000, 2),
+            'total_ms': round(self.total * 1000, 2),
+        }
+
+
+def timed_serializer_data(data):
+    """Свойство serializer.data, добавляющее время к замерам запроса.
+
+    Вложенные обращения к data не считаются повторно.
+    """
+    def get_data(serializer):
+        timing = current_timing.get()
+        if timing is None or timing.serializing:
+            return data.fget(serializer)
+        timing.serializing = True
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            timing.serialize += time.perf_counter() - started
+            timing.serializing = False
+
+    get_data.timed = True
+    return property(get_data)
+
+
+class RequestTimingMiddleware:
+    """Считает запросы к базе и время обработки каждого запроса.
+
+    Результат добавляется в заголовок Server-Timing и с вероятностью
+    REQUEST_TIMING_SAMPLE_RATE пишется в лог api.timing одной строкой
+    JSON. Запросы дольше REQUEST_TIMING_SLOW_MS или с числом запросов к
+    базе больше REQUEST_TIMING_MAX_QUERIES пишутся в лог всегда, вместе
+    с самыми долгими SQL. Время потоковой выдачи тела ответа не входит
+    в замеры. Для замера сериализации middleware при создании оборачивает
+    BaseSerializer.data.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        self.slow_ms = settings.REQUEST_TIMING_SLOW_MS
+        self.max_queries = settings.REQUEST_TIMING_MAX_QUERIES
+        self.slowest = settings.REQUEST_TIMING_SLOWEST_QUERIES
+        if not getattr(BaseSerializer.data.fget, 'timed', False):
+            BaseSerializer.data = timed_serializer_data(BaseSerializer.data)
+
+    def __call__(self, request):
+        timing = request.timing = RequestTiming(self.slowest)
+        token = current_timing.set(timing)
+        try:
+            with connection.execute_wrapper(timing):
+                response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        timing.finish()
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={timing.sql * 1000:.2f};desc="{timing.queries} queries"',
+            f'serialize;dur={timing.serialize * 1000:.2f}',
+            f'view;dur={timing.view * 1000:.2f}',
+            f'render;dur={timing.render * 1000:.2f}',
+            f'total;dur={timing.total * 1000:.2f}',
+        ))
+        slow = (
+            timing.total * 1000 > self.slow_ms
+            or timing.queries > self.max_queries
+        )
+        if slow or random.random() < self.sample_rate:
+            self.log(request, response, timing, slow)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timing.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request.timing.render_started = time.perf_counter()
+        response.add_post_render_callback(request.timing.rendered)
+        return response
+
+    def log(self, request, response, timing, slow):
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **timing.as_dict(),
+        }
+        if not slow:
+            logger.info(json.dumps(record, ensure_ascii=False))
+            return
+        record['slowest'] = [
+            {'ms': round(duration * 1000, 2), 'number': number, 'sql': sql}
+            for duration, number, sql in sorted(timing.slowest, reverse=True)
+        ]
+        logger.warning(json.dumps(record, ensure_ascii=False))
+
+
+def get_view_labels(view_func, method):
+    """Имя представления и действие: RecipeViewSet и list, favorite."""
+    view = getattr(view_func, 'cls', view_func)
+    actions = getattr(view_func, 'actions', None) or {}
+    return (
+        getattr(view, '__qualname__', type(view).__name__),
+        actions.get(method.lower(), method.lower()),
+    )
+
+
+class MetricsMiddleware:
+    """Собирает метрики запросов по представлениям и действиям DRF.
+
+    Метрики выгружает /api/metrics, см. api.metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = RequestTiming(0)
+        reused = connection.connection is not None
+        with connection.execute_wrapper(timing):
+            response = self.get_response(request)
+        timing.finish()
+        view, action = getattr(request, 'metrics_labels', ('', ''))
+        registry.inc(
+            REQUESTS, view=view, action=action, method=request.method,
+            status=response.status_code)
+        registry.observe(DURATION, timing.total, view=view, action=action)
+        registry.observe(QUERIES, timing.queries, view=view, action=action)
+        if timing.queries:
+            registry.inc(CONNECTIONS, state='reused' if reused else 'new')
+        registry.flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_labels = get_view_labels(view_func, request.method)
+
+
+def get_api_user(request):
+    """Пользователь запроса по аутентификации DRF: токен, Basic, сессия."""
+    if request.user.is_authenticated:
+        return request.user
+    try:
+        return Request(request, authenticators=[
+            authenticator()
+            for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        ]).user
+    except APIException:
+        return AnonymousUser()
+
+
+class ProfilingMiddleware:
+    """Профилирует один запрос сотрудника через cProfile.
+
+    Профилируются представление и рендер ответа, если в запросе есть
+    заголовок X-Profile или параметр profile, а пользователь - сотрудник.
+    Результат сохраняется в PROFILE_DIR и доступен в админке, хранятся
+    последние PROFILE_MAX_FILES профилей. Запросы без флага middleware
+    не трогает.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if 'X-Profile' not in request.headers and 'profile' not in request.GET:
+            return None
+        user = get_api_user(request)
+        if not user.is_staff:
+            return None
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        response = profiler.runcall(
+            self.run_view, request, view_func, view_args, view_kwargs)
+        duration = time.perf_counter() - started
+        self.save(profiler, request, user, response, duration)
+        return response
+
+    def run_view(self, request, view_func, view_args, view_kwargs):
+        response = view_func(request, *view_args, **view_kwargs)
+        if callable(getattr(response, 'render', None)):
+            response.render()
+        return response
+
+    def save(self, profiler, request, user, response, duration):
+        directory = Path(settings.PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        file_name = f'{timezone.now():%Y%m%d-%H%M%S}-{uuid4().hex[:8]}.prof'
+        profiler.dump_stats(directory / file_name)
+        ProfileCapture.objects.create(
+            user=user,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            status=response.status_code,
+            duration_ms=round(duration * 1000, 2),
+            file_name=file_name,
+        )
+        # Файлы старых профилей удаляет сигнал post_delete.
+        for capture in ProfileCapture.objects.order_by(
+                '-created_at', '-pk')[settings.PROFILE_MAX_FILES:]:
+            capture.delete()
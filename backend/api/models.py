@@ -0,0 +1,38 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.db import models
+
+
+class ProfileCapture(models.Model):
+    """Профиль cProfile одного запроса, файл лежит в PROFILE_DIR."""
+
+    created_at = models.DateTimeField(
+        'Дата',
+        auto_now_add=True,
+        db_index=True,
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        verbose_name='Пользователь',
+        related_name='profile_captures',
+    )
+    method = models.CharField('Метод', max_length=10)
+    path = models.CharField('Адрес', max_length=500)
+    status = models.PositiveSmallIntegerField('Статус ответа')
+    duration_ms = models.FloatField('Время, мс')
+    file_name = models.CharField('Файл', max_length=100, unique=True)
+
+    class Meta:
+        verbose_name = 'профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+        ordering = ('-created_at', )
+
+    def __str__(self):
+        return f'{self.method} {self.path}'
+
+    @property
+    def file_path(self):
+        return Path(settings.PROFILE_DIR) / self.file_name
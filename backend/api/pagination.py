@@ -1,7 +1,174 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """Оценивает число строк по плану запроса без COUNT(*).
+
+    Оценку дает только PostgreSQL, на других базах считается точно.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        return cursor.fetchone()[0][0]['Plan']['Plan Rows']
 
 
 class PaginationWithLimit(PageNumberPagination):
+    """Постраничная пагинация с параметром limit.
+
+    Параметр count управляет подсчетом общего числа объектов:
+    exact (по умолчанию) - COUNT(*), estimate - оценка по плану запроса,
+    none - без подсчета.
+    """
+
+    page_size_query_param = 'limit'
+    max_page_size = settings.PAGINATION_MAX_LIMIT
+    count_query_param = 'count'
+    count_modes = ('exact', 'estimate', 'none')
+
+    def get_count_mode(self, request, default='exact'):
+        mode = request.query_params.get(self.count_query_param, default)
+        return mode if mode in self.count_modes else default
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_mode = self.get_count_mode(request)
+        if self.count_mode == 'exact':
+            return super().paginate_queryset(queryset, request, view)
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            self.page_number = int(
+                request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            self.page_number = 0
+        if self.page_number < 1:
+            raise NotFound(self.invalid_page_message)
+        offset = (self.page_number - 1) * page_size
+        objects = list(queryset[offset:offset + page_size + 1])
+        self.has_next = len(objects) > page_size
+        self.count = None
+        if self.count_mode == 'estimate':
+            self.count = estimate_count(queryset)
+        self.request = request
+        return objects[:page_size]
+
+    def get_next_link(self):
+        if self.count_mode == 'exact':
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.count_mode == 'exact':
+            return super().get_previous_link()
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        if self.count_mode == 'exact':
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class RecipePagination(PaginationWithLimit):
+    """Пагинация ленты рецептов.
+
+    С параметром cursor включается курсорный режим по ключу
+    (created_at, id): следующая страница выбирается условием по ключу
+    вместо OFFSET. Первая страница запрашивается с пустым cursor.
+    При другой сортировке (ordering) используется постраничный режим.
+    """
+
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_query_param not in request.query_params
+                or self.ordering_query_param in request.query_params):
+            self.cursor_mode = False
+            return super().paginate_queryset(queryset, request, view)
+        self.cursor_mode = True
+        self.count_mode = self.get_count_mode(request, default='none')
+        self.count = None
+        if self.count_mode == 'exact':
+            self.count = queryset.count()
+        elif self.count_mode == 'estimate':
+            self.count = estimate_count(queryset)
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-created_at', '-id')
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            created_at, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at)
+                | Q(created_at=created_at, id__lt=pk)
+            )
+        objects = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(objects) > page_size:
+            last = objects[page_size - 1]
+            self.next_cursor = self.encode_cursor(last.created_at, last.id)
+        self.request = request
+        return objects[:page_size]
+
+    def encode_cursor(self, created_at, pk):
+        return base64.urlsafe_b64encode(
+            f'{created_at.isoformat()}|{pk}'.encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            created_at, pk = base64.urlsafe_b64decode(
+                cursor.encode()).decode().split('|')
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param, self.next_cursor)
 
-    def get_page_size(self, request):
-        return request.query_params.get('limit', 6)
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
@@ -0,0 +1,152 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.functional import cached_property
+from recipes.models import Ingredient
+
+from backend.constants import SEARCH_LIMIT, SEARCH_SIMILARITY
+
+from .cache import CATALOG, get_version
+
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(name):
+    return name.strip().lower()
+
+
+def get_trigrams(value):
+    """Триграммы строки по правилам pg_trgm: по словам, с пробелами."""
+    trigrams = set()
+    for word in WORD_RE.findall(value.lower()):
+        word = f'  {word} '
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+class IngredientIndex:
+    """Отсортированный массив ингредиентов для поиска по префиксу.
+
+    Названия хранятся в нормализованном виде, префикс ищется двумя
+    бинарными поисками, результат уже имеет форму IngredientSerilizer.
+    Для нечеткого поиска лениво строится инвертированный индекс
+    триграмм.
+    """
+
+    def __init__(self, ingredients):
+        rows = sorted(
+            (normalize(name), pk, name, measurement_unit)
+            for pk, name, measurement_unit in ingredients
+        )
+        self.keys = [row[0] for row in rows]
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in rows
+        ]
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def prefix_range(self, prefix):
+        start = bisect_left(self.keys, prefix)
+        return start, bisect_left(self.keys, prefix + '\U0010ffff', start)
+
+    def startswith(self, prefix):
+        start, end = self.prefix_range(normalize(prefix))
+        return self.items[start:end]
+
+    @cached_property
+    def trigrams(self):
+        """Словарь триграмма -> позиции и число триграмм каждого названия."""
+        postings = {}
+        sizes = []
+        for position, key in enumerate(self.keys):
+            trigrams = get_trigrams(key)
+            sizes.append(len(trigrams))
+            for trigram in trigrams:
+                postings.setdefault(trigram, []).append(position)
+        return postings, sizes
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Ищет с учетом опечаток и слов в середине названия.
+
+        Сначала идут совпадения по началу названия, затем остальные
+        по убыванию сходства триграмм.
+        """
+        query = normalize(query)
+        query_trigrams = get_trigrams(query)
+        if not query or not query_trigrams:
+            return []
+        with self.lock:
+            postings, sizes = self.trigrams
+        shared = Counter()
+        for trigram in query_trigrams:
+            shared.update(postings.get(trigram, ()))
+        start, end = self.prefix_range(query)
+        ranked = []
+        for position in shared.keys() | set(range(start, end)):
+            common = shared[position]
+            similarity = common / (
+                len(query_trigrams) + sizes[position] - common)
+            is_prefix = start <= position < end
+            if (is_prefix or similarity >= SEARCH_SIMILARITY
+                    or query in self.keys[position]):
+                ranked.append((not is_prefix, -similarity, position))
+        ranked.sort()
+        return [self.items[position] for *_, position in ranked[:limit]]
+
+    @classmethod
+    def from_database(cls):
+        return cls(Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit').order_by().iterator())
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_ingredient_index():
+    """Возвращает индекс ингредиентов, пересобирая его при смене версии."""
+    global _index, _index_version
+    version = get_version(CATALOG)
+    if _index_version != version:
+        with _index_lock:
+            if _index_version != version:
+                _index = IngredientIndex.from_database()
+                _index_version = version
+    return _index
+
+
+def search_ingredients(query, limit=SEARCH_LIMIT):
+    """Нечеткий поиск ингредиентов.
+
+    На PostgreSQL использует pg_trgm и GIN-индекс по названию,
+    на остальных базах - триграммный индекс в памяти процесса. Оба
+    оператора фильтра (% и %>) обслуживаются индексом name gin_trgm_ops;
+    %> находит и слова в середине названия.
+    """
+    if connection.vendor != 'postgresql':
+        return get_ingredient_index().search(query, limit)
+    query = query.strip()
+    if not query:
+        return []
+    return list(Ingredient.objects.annotate(
+        similarity=TrigramWordSimilarity(query, 'name'),
+        is_prefix=Case(
+            When(name__istartswith=query, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+    ).filter(
+        Q(name__trigram_word_similar=query)
+        | Q(name__trigram_similar=query)
+    ).order_by(
+        '-is_prefix', '-similarity', 'name'
+    ).values('id', 'name', 'measurement_unit')[:limit])
@@ -1,13 +1,22 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import models, transaction
 from djoser.serializers import UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from recipes.models import (Favorites, Ingredient, IngredientIndividual,
-                            Recipe, ShoppingList, Tag)
+                            Recipe, ShoppingList, ShoppingListTotal, Tag,
+                            change_counter)
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
+from rest_framework.settings import api_settings
 from users.models import Follow
 
-from .utils import get_field
+from backend.constants import MAX_BULK_RECIPES
+from backend.db import insert_ignore
+
+from .cache import get_recipe_cache_keys
+from .metrics import count_cache
+from .utils import get_followed_ids, get_user_flag, limit_recipes
 
 User = get_user_model()
 
@@ -22,7 +31,12 @@ class CustomUserSerializer(UserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        return get_field(self, obj, Follow, 'following')
+        request = self.context.get('request')
+        return bool(
+            request
+            and request.user.is_authenticated
+            and obj.id in get_followed_ids(request)
+        )
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -63,7 +77,23 @@ class IngredientIndividualSerializerCreate(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        return self.child.represent_many(data)
+
+
 class RecipeGetSerializer(serializers.ModelSerializer):
+    """Рецепт для чтения.
+
+    Часть ответа, одинаковая для всех пользователей, кэшируется для
+    каждого рецепта; признаки is_favorited, is_in_shopping_cart и
+    author.is_subscribed вычисляются для каждого запроса.
+    """
+
+    cache_representation = True
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
     is_favorited = serializers.SerializerMethodField()
@@ -80,12 +110,54 @@ class RecipeGetSerializer(serializers.ModelSerializer):
                   'is_favorited', 'is_in_shopping_cart'
                   )
         model = Recipe
+        list_serializer_class = RecipeListSerializer
 
     def get_is_favorited(self, obj):
-        return get_field(self, obj, Favorites, 'recipe')
+        return get_user_flag(self, obj, Favorites, 'is_favorited')
 
     def get_is_in_shopping_cart(self, obj):
-        return get_field(self, obj, ShoppingList, 'recipe')
+        return get_user_flag(
+            self, obj, ShoppingList, 'is_in_shopping_cart')
+
+    def to_representation(self, instance):
+        if not self.cache_representation:
+            return super().to_representation(instance)
+        return self.represent_many([instance])[0]
+
+    def represent_many(self, recipes):
+        recipes = list(recipes)
+        keys = get_recipe_cache_keys(recipes, self.context.get('request'))
+        cached = cache.get_many(keys.values())
+        count_cache('recipe', len(cached), len(keys))
+        missing = {}
+        result = []
+        for recipe in recipes:
+            shared = cached.get(keys[recipe.pk])
+            if shared is None:
+                data = super().to_representation(recipe)
+                author = dict(data['author'])
+                author.pop('is_subscribed')
+                missing[keys[recipe.pk]] = {
+                    **{
+                        field: value for field, value in data.items()
+                        if field not in ('is_favorited', 'is_in_shopping_cart')
+                    },
+                    'author': author,
+                }
+                result.append(data)
+                continue
+            result.append({
+                **shared,
+                'author': {
+                    **shared['author'],
+                    'is_subscribed': self.fields[
+                        'author'].get_is_subscribed(recipe.author),
+                },
+                'is_favorited': self.get_is_favorited(recipe),
+                'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+            })
+        cache.set_many(missing, timeout=settings.RECIPE_CACHE_TIMEOUT)
+        return result
 
 
 class RecipeSerializerCreate(serializers.ModelSerializer):
@@ -140,23 +212,71 @@ class RecipeSerializerCreate(serializers.ModelSerializer):
                 {'ingredients': 'Уже добавлен в этот рецепт!'})
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredientindividual_set')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.bulk_create_objects(ingredients, recipe)
+        change_counter(
+            User.objects.filter(pk=recipe.author_id), 'recipes_count', 1)
         return recipe
 
+    def update_ingredients(self, ingredients, recipe):
+        """Приводит ингредиенты рецепта к ingredients.
+
+        Меняются только отличающиеся строки: новые добавляются,
+        измененные количества обновляются, лишние удаляются.
+        Возвращает прежние количества {ingredient: amount}.
+        """
+        rows = {
+            row.ingredient_id: row
+            for row in IngredientIndividual.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient: row.amount for ingredient, row in rows.items()
+        }
+        to_create, to_update = [], []
+        for ingredient in ingredients:
+            row = rows.pop(ingredient['id'].id, None)
+            if row is None:
+                to_create.append(ingredient)
+            elif row.amount != ingredient['amount']:
+                row.amount = ingredient['amount']
+                to_update.append(row)
+        if rows:
+            IngredientIndividual.objects.filter(
+                pk__in=[row.pk for row in rows.values()]).delete()
+        if to_update:
+            IngredientIndividual.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            self.bulk_create_objects(to_create, recipe)
+        return old_amounts
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredientindividual_set')
         tags = validated_data.pop('tags')
-        instance = super().update(instance, validated_data)
-        instance.tags.clear()
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        # Счетчики меняются через F(), их нельзя перезаписывать.
+        instance.save(update_fields=[*validated_data, 'updated_at'])
         instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.bulk_create_objects(ingredients, instance)
-        instance.save()
+        old_amounts = self.update_ingredients(ingredients, instance)
+        amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        ShoppingListTotal.objects.change(
+            ShoppingList.objects.filter(
+                recipe=instance).values_list('user', flat=True),
+            {
+                ingredient: amounts.get(ingredient, 0)
+                - old_amounts.get(ingredient, 0)
+                for ingredient in amounts.keys() | old_amounts.keys()
+            }
+        )
         return instance
 
     def to_representation(self, instance):
@@ -166,6 +286,7 @@ class RecipeSerializerCreate(serializers.ModelSerializer):
 
 
 class RecipeSerializer(RecipeGetSerializer):
+    cache_representation = False
 
     class Meta:
         model = Recipe
@@ -184,12 +305,18 @@ class FollowSerializerCreate(serializers.ModelSerializer):
         if self.context['request'].user == data['following']:
             raise serializers.ValidationError(
                 'Не может быть подписан сам на себя!')
-        if Follow.objects.filter(user=data['user'],
-                                 following=data['following']).exists():
-            raise serializers.ValidationError(
-                'Уже подписан!')
         return data
 
+    def create(self, validated_data):
+        if not insert_ignore(
+            Follow, ('user', 'following'),
+            [(validated_data['user'].pk, validated_data['following'].pk)],
+            returning='following',
+        ):
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: ['Уже подписан!']})
+        return Follow(**validated_data)
+
     def to_representation(self, instance):
         serializer = FollowSerializer(
             instance.following,
@@ -199,7 +326,6 @@ class FollowSerializerCreate(serializers.ModelSerializer):
 
 class FollowSerializer(CustomUserSerializer):
     recipes = serializers.SerializerMethodField('paginated_recipes')
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta(CustomUserSerializer.Meta):
         fields = CustomUserSerializer.Meta.fields + (
@@ -208,37 +334,29 @@ class FollowSerializer(CustomUserSerializer):
         )
 
     def paginated_recipes(self, obj):
-        recipes = Recipe.objects.filter(
-            author=obj).order_by('-created_at')
-        try:
-            recipes = recipes[
-                :int(self.context['request'].query_params.get(
-                    'recipes_limit'))
-            ]
-# Если нет параметра, то None - TypeError, а если не int - ValueError
-# Если нет параметра, то передается в сериализатор список рецептов без среза
-        except (TypeError, ValueError):
-            pass
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes = limit_recipes(
+                Recipe.objects.filter(author=obj).order_by('-created_at'),
+                self.context['request'])
         serializer = RecipeSerializer(recipes, many=True)
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
-
 
 class ShoppingListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ShoppingList
         fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=model.objects.all(),
-                fields=('user', 'recipe'),
-                message=('Рецепт уже добавлен')
 
-            )
-        ]
+    def create(self, validated_data):
+        model = self.Meta.model
+        if not model.objects.add(
+                validated_data['user'], [validated_data['recipe'].pk]):
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: ['Рецепт уже добавлен']})
+        return model(**validated_data)
 
     def to_representation(self, instance):
         serializer = RecipeUserSerializer(
@@ -259,10 +377,14 @@ class FavoritesSerializer(ShoppingListSerializer):
     class Meta:
         model = Favorites
         fields = ('user', 'recipe')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=model.objects.all(),
-                fields=('user', 'recipe'),
-                message=('Рецепт уже добавлен')
-            )
-        ]
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES,
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
@@ -0,0 +1,107 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save)
+from django.dispatch import receiver
+from django.utils import timezone
+from recipes.models import Ingredient, IngredientIndividual, Recipe, Tag
+
+from .cache import (CATALOG, RECIPES, USERS, bump_version,
+                    get_author_version_name)
+from .models import ProfileCapture
+
+User = get_user_model()
+touched = threading.local()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+@receiver((post_save, post_delete), sender=Ingredient)
+def bump_catalog_version(**kwargs):
+    transaction.on_commit(lambda: bump_version(CATALOG))
+
+
+# Поля пользователя, которые входят в представление автора рецепта.
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+
+def get_author_data(user):
+    # Отложенные поля не загружаются, чтобы не делать лишних запросов.
+    return tuple(user.__dict__.get(field) for field in AUTHOR_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_author_data(instance, **kwargs):
+    instance._author_data = get_author_data(instance)
+
+
+@receiver(post_save, sender=User)
+def bump_users_version(instance, created, update_fields=None, **kwargs):
+    """Сбрасывает кэш рецептов автора при изменении его имени или почты.
+
+    Общая версия USERS, от которой зависит лента, меняется только для
+    авторов, у которых есть рецепты.
+    """
+    if created or update_fields and not set(update_fields) & set(
+            AUTHOR_FIELDS):
+        return
+    data = get_author_data(instance)
+    if data == instance._author_data:
+        return
+    instance._author_data = data
+
+    def bump():
+        bump_version(get_author_version_name(instance.pk))
+        if instance.recipes_count:
+            bump_version(USERS)
+
+    transaction.on_commit(bump)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def bump_recipes_version(**kwargs):
+    transaction.on_commit(lambda: bump_version(RECIPES))
+
+
+def touch_pending_recipes():
+    recipes, touched.recipes = getattr(touched, 'recipes', set()), set()
+    if recipes:
+        Recipe.objects.filter(pk__in=recipes).update(
+            updated_at=timezone.now())
+        # Лента пересобирается уже из новых представлений рецептов.
+        bump_version(RECIPES)
+
+
+def touch_recipes(recipes):
+    """Обновляет updated_at рецептов после коммита одним запросом.
+
+    От updated_at зависит ключ кэша представления рецепта, а ингредиенты
+    и теги меняются и без сохранения самого рецепта. Рецепты из
+    откаченной транзакции обновляются со следующим коммитом, лишнее
+    обновление только сбрасывает кэш.
+    """
+    touched.recipes = getattr(touched, 'recipes', set()) | set(recipes)
+    transaction.on_commit(touch_pending_recipes)
+
+
+@receiver((post_save, post_delete), sender=IngredientIndividual)
+def touch_ingredient_recipe(instance, **kwargs):
+    touch_recipes((instance.recipe_id, ))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def touch_tag_recipes(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        touch_recipes((instance.pk, ))
+    elif pk_set is not None:
+        touch_recipes(pk_set)
+    else:
+        touch_recipes(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=ProfileCapture)
+def delete_profile_file(instance, **kwargs):
+    instance.file_path.unlink(missing_ok=True)
@@ -1,13 +1,108 @@
-def get_field(self, obj, model, field):
-    object_dict = {
-        field: obj.id,
-        'user': self.context.get('request').user.id
-    }
-    return bool(
-        self.context.get(
-            'request'
-        ) and self.context[
-            'request'
-        ].user.is_authenticated and model.objects.filter(
-            **object_dict)
-    )
+import csv
+import json
+
+from rest_framework.serializers import ListSerializer
+from users.models import Follow
+
+
+def get_followed_ids(request):
+    """Возвращает id авторов, на которых подписан текущий пользователь.
+
+    Подписки загружаются одним запросом и запоминаются на время запроса.
+    """
+    if not hasattr(request, 'followed_ids'):
+        request.followed_ids = set(Follow.objects.filter(
+            user=request.user
+        ).order_by().values_list('following', flat=True))
+    return request.followed_ids
+
+
+def limit_recipes(recipes, request):
+    """Обрезает рецепты по параметру recipes_limit, если он передан."""
+    try:
+        return recipes[:int(request.query_params.get('recipes_limit'))]
+# Если нет параметра, то None - TypeError, а если не int - ValueError
+# Если нет параметра, то передается в сериализатор список рецептов без среза
+    except (TypeError, ValueError):
+        return recipes
+
+
+def get_user_flag(self, obj, model, annotation):
+    """Возвращает признак связи рецепта с текущим пользователем.
+
+    Берет значение из аннотации queryset, а если ее нет, одним запросом
+    загружает признак для всех рецептов родительского списка.
+    """
+    if hasattr(obj, annotation):
+        return getattr(obj, annotation)
+    request = self.context.get('request')
+    if not request or not request.user.is_authenticated:
+        return False
+    flags = self.context.setdefault('user_flags', {}).setdefault(
+        annotation, {})
+    if obj.id not in flags:
+        recipes = [obj]
+        if isinstance(self.parent, ListSerializer):
+            recipes = self.parent.instance
+        ids = {recipe.id for recipe in recipes} | {obj.id}
+        flags.update(dict.fromkeys(ids, False))
+        flags.update(dict.fromkeys(model.objects.filter(
+            user=request.user, recipe__in=ids
+        ).order_by().values_list('recipe', flat=True), True))
+    return flags[obj.id]
+
+
+class Echo:
+    """Псевдобуфер: csv.writer сразу получает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_lines(ingredients):
+    """Построчно отдает список покупок для потоковой выгрузки."""
+    yield 'Для приготовления понадобится:\n'
+    for ingredient in ingredients.iterator():
+        yield (
+            f"{ingredient['ingredient__name']} - "
+            f"{ingredient['total_amount']} "
+            f"{ingredient['ingredient__measurement_unit']}\n"
+        )
+
+
+def shopping_cart_csv(ingredients):
+    """Отдает список покупок в формате CSV."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients.iterator():
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['total_amount'],
+        ))
+
+
+def shopping_cart_json(ingredients):
+    """Отдает список покупок компактным JSON-массивом."""
+    yield '['
+    separator = ''
+    for ingredient in ingredients.iterator():
+        yield separator + json.dumps(
+            {
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient[
+                    'ingredient__measurement_unit'],
+                'amount': ingredient['total_amount'],
+            },
+            ensure_ascii=False,
+            separators=(',', ':'),
+        )
+        separator = ','
+    yield ']'
+
+
+SHOPPING_CART_EXPORTS = {
+    'txt': shopping_cart_lines,
+    'csv': shopping_cart_csv,
+    'json': shopping_cart_json,
+}
@@ -1,27 +1,40 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
+from djoser import utils
 from djoser.views import UserViewSet
 from recipes.models import (Favorites, Ingredient, IngredientIndividual,
-                            Recipe, ShoppingList, Tag)
+                            Recipe, ShoppingList, ShoppingListTotal, Tag,
+                            change_counter, delete_user, get_recipe_amounts,
+                            get_recipes_amounts)
 from rest_framework import viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.status import (HTTP_201_CREATED, HTTP_204_NO_CONTENT,
                                    HTTP_400_BAD_REQUEST)
+from rest_framework.views import APIView
 from users.models import Follow
 
+from backend.db import delete_returning
+
+from .cache import AnonymousFeedCacheMixin, CatalogCacheMixin
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import PaginationWithLimit
+from .metrics import registry
+from .pagination import PaginationWithLimit, RecipePagination
 from .permissions import OwnerOnly, OwnerOrReadOnly
+from .renderers import CSVRenderer, PlainTextRenderer
+from .search import get_ingredient_index, search_ingredients
 from .serializers import (CustomUserSerializer, FavoritesSerializer,
                           FollowSerializer, FollowSerializerCreate,
                           IngredientSerilizer, RecipeGetSerializer,
-                          RecipeSerializerCreate, ShoppingListSerializer,
-                          TagSerializer)
+                          RecipeIdsSerializer, RecipeSerializerCreate,
+                          ShoppingListSerializer, TagSerializer)
+from .utils import SHOPPING_CART_EXPORTS, limit_recipes
 
 User = get_user_model()
 
@@ -36,6 +49,15 @@ class CustomUserViewSet(UserViewSet):
             return (OwnerOnly(), )
         return super().get_permissions()
 
+    def destroy(self, request, *args, **kwargs):
+        instance = self.get_object()
+        self.get_serializer(instance, data=request.data).is_valid(
+            raise_exception=True)
+        if instance == request.user:
+            utils.logout_user(request)
+        delete_user(instance)
+        return Response(status=HTTP_204_NO_CONTENT)
+
     @action(
         methods=[
             'post'
@@ -52,19 +74,25 @@ class CustomUserViewSet(UserViewSet):
             context={'request': request}
         )
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            change_counter(
+                User.objects.filter(pk=id), 'followers_count', 1)
         return Response(status=HTTP_201_CREATED, data=serializer.data)
 
     @subscribe.mapping.delete
     def subscribe_delete(self, request, id=None):
         get_object_or_404(User, id=id)
-        if not Follow.objects.filter(
-            user=request.user.id,
-            following=id
-        ).delete()[0]:
-            return Response(
-                {'errors': 'Пользователь не подписан'},
-                status=HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            if not Follow.objects.filter(
+                user=request.user.id,
+                following=id
+            ).delete()[0]:
+                return Response(
+                    {'errors': 'Пользователь не подписан'},
+                    status=HTTP_400_BAD_REQUEST)
+            change_counter(
+                User.objects.filter(pk=id), 'followers_count', -1)
         return Response(status=HTTP_204_NO_CONTENT)
 
     @action(
@@ -78,28 +106,57 @@ class CustomUserViewSet(UserViewSet):
         detail=False,
     )
     def subscriptions(self, request):
-        following = User.objects.filter(followers__user=request.user)
+        following = User.objects.filter(
+            followers__user=request.user
+        ).order_by('username').prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=limit_recipes(
+                    Recipe.objects.order_by('-created_at'), request),
+                to_attr='limited_recipes',
+            )
+        )
         page = self.paginate_queryset(following)
         serializer = FollowSerializer(
             page, many=True, context={'request': request})
         return self.get_paginated_response(serializer.data)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(AnonymousFeedCacheMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all().select_related(
         'author').prefetch_related(
             'tags',
-            'ingredients').order_by('-created_at')
-    pagination_class = PaginationWithLimit
+            Prefetch(
+                'ingredientindividual_set',
+                queryset=IngredientIndividual.objects.select_related(
+                    'ingredient'),
+            )).order_by('-created_at')
+    pagination_class = RecipePagination
     permission_classes = (OwnerOrReadOnly, )
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        return super().get_queryset().with_user_flags(self.request.user)
+
     def get_serializer_class(self):
-        if self.action == 'list' or self.action == 'retrive':
+        if self.action == 'list' or self.action == 'retrieve':
             return RecipeGetSerializer
         return RecipeSerializerCreate
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        users = ShoppingList.objects.filter(
+            recipe=instance).values_list('user', flat=True)
+        ShoppingListTotal.objects.change(
+            users,
+            {ingredient: -amount for ingredient, amount in
+             get_recipe_amounts(instance).items()}
+        )
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', -1)
+        instance.delete()
+
     @action(
         methods=[
             'post'
@@ -114,7 +171,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data={"user": request.user.id, "recipe": pk},
             context={'request': request, 'pk': pk})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            shopping_list = serializer.save()
+            ShoppingListTotal.objects.add_recipe(
+                request.user, shopping_list.recipe)
         return Response(status=HTTP_201_CREATED, data=serializer.data)
 
     @shopping_cart.mapping.delete
@@ -122,10 +182,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
         recipe = get_object_or_404(
             Recipe,
             pk=pk)
-        if ShoppingList.objects.filter(
-            recipe=recipe, user=request.user
-        ).delete()[0]:
-            return Response(status=HTTP_204_NO_CONTENT)
+        with transaction.atomic():
+            if ShoppingList.objects.filter(
+                recipe=recipe, user=request.user
+            ).delete()[0]:
+                ShoppingListTotal.objects.remove_recipe(request.user, recipe)
+                return Response(status=HTTP_204_NO_CONTENT)
         return Response(
             status=HTTP_400_BAD_REQUEST,
             data={"errors": "Такого рецепта нет в списке покупок"}
@@ -145,7 +207,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data={"user": request.user.id, "recipe": pk},
             context={'request': request, 'pk': pk})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            change_counter(
+                Recipe.objects.filter(pk=pk), 'favorites_count', 1)
         return Response(status=HTTP_201_CREATED, data=serializer.data)
 
     @favorite.mapping.delete
@@ -153,14 +218,92 @@ class RecipeViewSet(viewsets.ModelViewSet):
         recipe = get_object_or_404(
             Recipe,
             pk=pk)
-        if Favorites.objects.filter(
-            recipe=recipe,
-            user=request.user
-        ).delete()[0]:
-            return Response(status=HTTP_204_NO_CONTENT)
+        with transaction.atomic():
+            if Favorites.objects.filter(
+                recipe=recipe,
+                user=request.user
+            ).delete()[0]:
+                change_counter(
+                    Recipe.objects.filter(pk=pk), 'favorites_count', -1)
+                return Response(status=HTTP_204_NO_CONTENT)
         return Response(status=HTTP_400_BAD_REQUEST,
                         data={"errors": "Такого рецепта нет в избранном"})
 
+    def bulk_change(self, request, model, on_change):
+        """Добавляет или удаляет рецепты из списка пользователя пачкой.
+
+        POST добавляет, DELETE удаляет рецепты из поля recipes. Для каждого
+        id возвращается результат: added, exists, removed, missing или
+        not_found. Число запросов не зависит от длины списка.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['recipes']
+        present = dict(Recipe.objects.filter(pk__in=ids).annotate(
+            present=Exists(model.objects.filter(
+                user=request.user, recipe=OuterRef('pk')))
+        ).order_by().values_list('pk', 'present'))
+        add = request.method == 'POST'
+        changed = [pk for pk in ids if present.get(pk) is (not add)]
+        with transaction.atomic():
+            if add:
+                changed = model.objects.add(request.user, changed)
+            else:
+                changed = delete_returning(model.objects.filter(
+                    user=request.user, recipe__in=changed), 'recipe')
+            if changed:
+                on_change(request.user, changed, 1 if add else -1)
+        changed = set(changed)
+        statuses = {
+            True: ('removed', 'added'),
+            False: ('missing', 'exists'),
+        }
+        return Response({'results': [
+            {
+                'id': pk,
+                'status': statuses[pk in changed][add]
+                if pk in present else 'not_found',
+            }
+            for pk in ids
+        ]})
+
+    @action(
+        methods=[
+            'post', 'delete'
+        ],
+        permission_classes=(
+            IsAuthenticated,
+        ),
+        url_path='favorite',
+        detail=False,
+    )
+    def favorite_bulk(self, request):
+        return self.bulk_change(
+            request, Favorites,
+            lambda user, recipes, sign: change_counter(
+                Recipe.objects.filter(pk__in=recipes),
+                'favorites_count', sign)
+        )
+
+    @action(
+        methods=[
+            'post', 'delete'
+        ],
+        permission_classes=(
+            IsAuthenticated,
+        ),
+        url_path='shopping_cart',
+        detail=False,
+    )
+    def shopping_cart_bulk(self, request):
+        return self.bulk_change(
+            request, ShoppingList,
+            lambda user, recipes, sign: ShoppingListTotal.objects.change(
+                (user.pk, ),
+                {ingredient: sign * amount for ingredient, amount in
+                 get_recipes_amounts(recipes).items()})
+        )
+
     @action(
         methods=[
             'get'
@@ -168,43 +311,64 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(
             IsAuthenticated,
         ),
+        renderer_classes=(
+            PlainTextRenderer,
+            CSVRenderer,
+            JSONRenderer,
+        ),
         detail=False,
     )
     def download_shopping_cart(self, request):
-        filename = 'test.txt'
-        filepath = 'static/data/' + filename
-        sourceFile = open(filepath, 'w', encoding='utf-8')
-        recipes_in_shopping_list = Recipe.objects.filter(
-            shoppinglist__user=self.request.user)
-        sourceFile.write('Для приготовления понадобится:\n')
-        ingredients = IngredientIndividual.objects.filter(
-            recipe=recipes_in_shopping_list[0])
-        for recipe in recipes_in_shopping_list[1:]:
-            ingredients = ingredients | IngredientIndividual.objects.filter(
-                recipe=recipe)
-        ingredient_array = []
-        for i in ingredients:
-            if i.ingredient not in ingredient_array:
-                amount = ingredients.filter(
-                    ingredient=i.ingredient).aggregate(res=Sum('amount'))
-                sourceFile.write(
-                    f"{i.ingredient.name} - {amount['res']} "
-                    f"{i.ingredient.measurement_unit}\n"
-                )
-            ingredient_array.append(i.ingredient)
-        sourceFile.close()
-        return FileResponse(open(filepath, 'rb'))
-
-
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+        ingredients = ShoppingListTotal.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            total_amount=F('amount')
+        ).order_by('ingredient__name')
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            SHOPPING_CART_EXPORTS[renderer.format](ingredients),
+            content_type=f'{renderer.media_type}; charset=utf-8'
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{renderer.format}"')
+        return response
+
+
+class TagViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerilizer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        if not {'name', 'search'} & request.query_params.keys():
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(self.search, request, *args, **kwargs)
+
+    def search(self, request, *args, **kwargs):
+        if 'search' in request.query_params:
+            return Response(
+                search_ingredients(request.query_params['search']))
+        return Response(
+            get_ingredient_index().startswith(request.query_params['name']))
+
+
+class MetricsView(APIView):
+    """Метрики всех процессов в текстовом формате Prometheus."""
+
+    permission_classes = (IsAdminUser, )
+    renderer_classes = (PlainTextRenderer, )
+
+    def get(self, request):
+        return Response(
+            registry.export(),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -2,3 +2,6 @@ MIN_VALUE = 1
 MAX_VALUE_AMOUNT = MAX_VALUE_TIME = 32000
 MAX_LENGHT_NAME = 200
 MAX_lENGTH_USER = 150
+SEARCH_LIMIT = 20
+SEARCH_SIMILARITY = 0.3
+MAX_BULK_RECIPES = 100
@@ -0,0 +1,99 @@
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, router
+
+
+def insert_ignore(model, fields, rows, returning):
+    """Вставляет строки одним INSERT ... ON CONFLICT DO NOTHING.
+
+    Строки, нарушающие уникальные ограничения, пропускаются без ошибки.
+    Возвращает значения поля returning у действительно вставленных строк.
+    Без поддержки RETURNING строки вставляются по одной и проверяются
+    по rowcount.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    opts = model._meta
+    columns = ', '.join(quote(opts.get_field(name).column) for name in fields)
+    returning_column = quote(opts.get_field(returning).column)
+    row_sql = '({})'.format(', '.join(['%s'] * len(fields)))
+    sql = (
+        f'INSERT INTO {quote(opts.db_table)} ({columns}) VALUES {{}} '
+        f'ON CONFLICT DO NOTHING'
+    )
+    with connection.cursor() as cursor:
+        if connection.features.can_return_rows_from_bulk_insert:
+            cursor.execute(
+                sql.format(', '.join([row_sql] * len(rows)))
+                + f' RETURNING {returning_column}',
+                [value for row in rows for value in row],
+            )
+            return [row[0] for row in cursor.fetchall()]
+        inserted = []
+        position = list(fields).index(returning)
+        for row in rows:
+            cursor.execute(sql.format(row_sql), row)
+            if cursor.rowcount:
+                inserted.append(row[position])
+        return inserted
+
+
+def delete_returning(queryset, returning):
+    """Удаляет строки queryset и возвращает их значения поля returning.
+
+    Возвращаются только строки, удаленные этим запросом: строки, которые
+    параллельно удалил другой запрос, в результат не попадают. Сигналы
+    удаления не отправляются. Без поддержки RETURNING строки удаляются
+    по одной и проверяются по rowcount.
+    """
+    model = queryset.model
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    opts = model._meta
+    table = quote(opts.db_table)
+    pk_column = quote(opts.pk.column)
+    returning_column = quote(opts.get_field(returning).column)
+    with connection.cursor() as cursor:
+        if connection.features.can_return_rows_from_bulk_insert:
+            try:
+                sql, params = queryset.order_by().values(
+                    'pk').query.get_compiler(connection=connection).as_sql()
+            except EmptyResultSet:
+                return []
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {pk_column} IN ({sql}) '
+                f'RETURNING {returning_column}',
+                params,
+            )
+            return [row[0] for row in cursor.fetchall()]
+        deleted = []
+        for pk, value in queryset.values_list('pk', returning):
+            cursor.execute(
+                f'DELETE FROM {table} WHERE {pk_column} = %s', (pk, ))
+            if cursor.rowcount:
+                deleted.append(value)
+        return deleted
+
+
+class CounterFieldsMixin:
+    """Не перезаписывает счетчики при сохранении объекта.
+
+    Счетчики из counter_fields меняются запросами UPDATE с F(). Полное
+    сохранение загруженного объекта записало бы прочитанные значения
+    поверх параллельных изменений, поэтому без явного update_fields
+    сохраняются все поля, кроме счетчиков.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
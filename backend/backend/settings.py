@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from django.core.management.utils import get_random_secret_key
@@ -29,6 +30,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -49,6 +51,43 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+REQUEST_TIMING = os.getenv('REQUEST_TIMING') == 'True'
+
+if REQUEST_TIMING:
+    MIDDLEWARE.insert(0, 'api.middleware.RequestTimingMiddleware')
+
+METRICS = os.getenv('METRICS') == 'True'
+
+if METRICS:
+    MIDDLEWARE.insert(0, 'api.middleware.MetricsMiddleware')
+
+METRICS_DIR = os.getenv(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'foodgram_metrics'))
+
+METRICS_FLUSH_INTERVAL = 5
+
+METRICS_RETENTION = int(os.getenv('METRICS_RETENTION', 24 * 60 * 60))
+
+PROFILING = os.getenv('PROFILING') == 'True'
+
+if PROFILING:
+    MIDDLEWARE.append('api.middleware.ProfilingMiddleware')
+
+PROFILE_DIR = os.getenv(
+    'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'foodgram_profiles'))
+
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 50))
+
+REQUEST_TIMING_SAMPLE_RATE = float(
+    os.getenv('REQUEST_TIMING_SAMPLE_RATE', 0.01))
+
+REQUEST_TIMING_SLOW_MS = float(os.getenv('REQUEST_TIMING_SLOW_MS', 500))
+
+REQUEST_TIMING_MAX_QUERIES = int(
+    os.getenv('REQUEST_TIMING_MAX_QUERIES', 30))
+
+REQUEST_TIMING_SLOWEST_QUERIES = 5
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES_DIR = BASE_DIR / 'templates'
@@ -90,6 +129,29 @@ else:
         }
     }
 
+# Версии кэша меняют и другие процессы gunicorn, и команды manage.py,
+# поэтому кэш по умолчанию общий, в файлах.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache')),
+    }
+}
+
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+RECIPE_CACHE_TIMEOUT = 60 * 60
+
+FEED_CACHE_TIMEOUT = 60 * 10
+
+FEED_CACHE_LOCK_TIMEOUT = 10
+
+FEED_CACHE_LOCK_WAIT = 2
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -136,6 +198,8 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 
+PAGINATION_MAX_LIMIT = int(os.getenv('PAGINATION_MAX_LIMIT', 100))
+
 DJOSER = {
     'HIDE_USERS': False,
     'SERIALIZERS': {
@@ -150,4 +214,27 @@ DJOSER = {
     }
 }
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'plain',
+        },
+    },
+    'loggers': {
+        'api.timing': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_TIMING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 CSRF_TRUSTED_ORIGINS = ['https://foodgramstudy.hopto.org']
@@ -1,37 +1,88 @@
-from itertools import chain
-
 from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Prefetch
 from users.models import Follow
 
 from .models import (Favorites, Ingredient, IngredientIndividual, Recipe,
-                     ShoppingList, Tag)
+                     ShoppingList, ShoppingListTotal, Tag, change_counter,
+                     get_cart_users)
+
+User = get_user_model()
+
+
+class CounterAdminMixin:
+    """Меняет счетчик объекта, на который ссылается строка.
+
+    Счетчик counter_field у объекта из поля counter_target растет при
+    добавлении строки в админке и уменьшается при ее удалении или
+    переносе на другой объект.
+    """
+
+    counter_target = None
+    counter_field = None
+
+    def change_counter(self, pks, delta):
+        model = self.model._meta.get_field(self.counter_target).related_model
+        change_counter(
+            model.objects.filter(pk__in=pks), self.counter_field, delta)
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        target = self.model.objects.filter(pk=obj.pk).values_list(
+            self.counter_target, flat=True).first()
+        super().save_model(request, obj, form, change)
+        new_target = getattr(obj, f'{self.counter_target}_id')
+        if target != new_target:
+            self.change_counter([new_target], 1)
+            self.change_counter([target], -1)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, self.model.objects.filter(pk=obj.pk))
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        for target, count in queryset.values_list(
+                self.counter_target).annotate(count=Count('pk')).order_by():
+            self.change_counter([target], -count)
+        super().delete_queryset(request, queryset)
 
 
 class IngredientIndividualInline(admin.TabularInline):
     def measurement_unit(self, obj):
-        return self.model.ingredient.measurement_unit
+        return obj.ingredient.measurement_unit
 
     model = IngredientIndividual
     fields = ['ingredient', 'amount', 'measurement_unit']
     readonly_fields = ('measurement_unit',)
+    autocomplete_fields = ('ingredient',)
     extra = 1
     min_num = 1
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
+
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(CounterAdminMixin, admin.ModelAdmin):
+    counter_target = 'following'
+    counter_field = 'followers_count'
     empty_value_display = "-Нет-"
     list_display = (
         'user',
         'following'
     )
-    search_fields = ('following',)
+    list_select_related = ('user', 'following')
+    autocomplete_fields = ('user', 'following')
+    search_fields = ('following__username',)
 
 
 class IngredientAdmin(admin.ModelAdmin):
-    list_filter = ('name', )
+    list_filter = ('measurement_unit', )
     list_display = (
         'name', 'measurement_unit', 'id'
     )
+    search_fields = ('^name', )
 
 
 class IngredientIndividualAdmin(admin.ModelAdmin):
@@ -43,6 +94,27 @@ class IngredientIndividualAdmin(admin.ModelAdmin):
         'amount', 'measurement_unit',
         'id'
     )
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        recipes = {obj.recipe_id, *IngredientIndividual.objects.filter(
+            pk=obj.pk).values_list('recipe', flat=True)}
+        super().save_model(request, obj, form, change)
+        ShoppingListTotal.objects.reconcile(get_cart_users(recipes))
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        users = get_cart_users([obj.recipe_id])
+        super().delete_model(request, obj)
+        ShoppingListTotal.objects.reconcile(users)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        users = get_cart_users(queryset.values('recipe'))
+        super().delete_queryset(request, queryset)
+        ShoppingListTotal.objects.reconcile(users)
 
 
 class RecipeAdmin(admin.ModelAdmin):
@@ -50,16 +122,55 @@ class RecipeAdmin(admin.ModelAdmin):
         'name', 'author', 'ingredient_for_recipe',
         'id', 'number_of_favorites', 'created_at'
     )
-    list_filter = ('name', 'author', 'tags')
+    list_filter = ('tags', )
+    list_select_related = ('author', )
+    search_fields = ('name', 'author__username')
+    autocomplete_fields = ('author', )
+    show_full_result_count = False
     inlines = (IngredientIndividualInline, )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch('ingredients', queryset=Ingredient.objects.only('name'))
+        )
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        author = Recipe.objects.filter(pk=obj.pk).values_list(
+            'author', flat=True).first()
+        super().save_model(request, obj, form, change)
+        if author != obj.author_id:
+            change_counter(
+                User.objects.filter(pk=obj.author_id), 'recipes_count', 1)
+            change_counter(
+                User.objects.filter(pk=author), 'recipes_count', -1)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Ингредиенты из инлайна меняют итоги корзин с этим рецептом.
+        ShoppingListTotal.objects.reconcile(get_cart_users([form.instance]))
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Recipe.objects.filter(pk=obj.pk))
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        users = get_cart_users(queryset)
+        for author, count in queryset.values_list('author').annotate(
+                count=Count('pk')).order_by():
+            change_counter(
+                User.objects.filter(pk=author), 'recipes_count', -count)
+        super().delete_queryset(request, queryset)
+        ShoppingListTotal.objects.reconcile(users)
+
+    @admin.display(description='Ингредиенты')
     def ingredient_for_recipe(self, obj):
-        ingredients = obj.ingredients.values_list('name')
-        return list(chain.from_iterable(ingredients))
+        return [ingredient.name for ingredient in obj.ingredients.all()]
 
+    @admin.display(description='В избранном', ordering='favorites_count')
     def number_of_favorites(self, obj):
-        count = Favorites.objects.filter(recipe=obj).count()
-        return count
+        return obj.favorites_count
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -72,12 +183,44 @@ class ShoppingListAdmin(admin.ModelAdmin):
     list_display = (
         'recipe', 'id', 'user'
     )
+    list_select_related = ('recipe', 'user')
+    autocomplete_fields = ('recipe', 'user')
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        users = {obj.user_id, *ShoppingList.objects.filter(
+            pk=obj.pk).values_list('user', flat=True)}
+        super().save_model(request, obj, form, change)
+        ShoppingListTotal.objects.reconcile(users)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingListTotal.objects.reconcile([obj.user_id])
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        users = set(queryset.values_list('user', flat=True))
+        super().delete_queryset(request, queryset)
+        ShoppingListTotal.objects.reconcile(users)
+
+
+class FavoritesAdmin(CounterAdminMixin, admin.ModelAdmin):
+    counter_target = 'recipe'
+    counter_field = 'favorites_count'
+    list_display = (
+        'recipe', 'id', 'user'
+    )
+    list_select_related = ('recipe', 'user')
+    autocomplete_fields = ('recipe', 'user')
 
 
-class FavoritesAdmin(admin.ModelAdmin):
+class ShoppingListTotalAdmin(admin.ModelAdmin):
     list_display = (
-        'recipe', 'id', 'user'
+        'user', 'ingredient', 'amount'
     )
+    list_select_related = ('user', 'ingredient')
+    autocomplete_fields = ('user', 'ingredient')
 
 
 class RecipeTagAdmin(admin.ModelAdmin):
@@ -93,4 +236,5 @@ admin.site.register(IngredientIndividual, IngredientIndividualAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(ShoppingList, ShoppingListAdmin)
+admin.site.register(ShoppingListTotal, ShoppingListTotalAdmin)
 admin.site.register(Favorites, FavoritesAdmin)
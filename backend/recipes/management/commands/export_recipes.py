@@ -0,0 +1,72 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+from recipes.models import IngredientIndividual, Recipe
+
+
+def serialize_recipes(recipes, chunk_size):
+    """Отдает рецепты по одному в виде словарей для NDJSON."""
+    recipes = recipes.select_related('author').prefetch_related(
+        'tags',
+        Prefetch(
+            'ingredientindividual_set',
+            queryset=IngredientIndividual.objects.select_related(
+                'ingredient'),
+        ),
+    ).order_by('pk')
+    for recipe in recipes.iterator(chunk_size=chunk_size):
+        yield {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'image': recipe.image.name,
+            'author': recipe.author.username,
+            'tags': [tag.slug for tag in recipe.tags.all()],
+            'ingredients': [
+                {
+                    'name': row.ingredient.name,
+                    'measurement_unit': row.ingredient.measurement_unit,
+                    'amount': row.amount,
+                }
+                for row in recipe.ingredientindividual_set.all()
+            ],
+        }
+
+
+class Command(BaseCommand):
+    """Выгружает рецепты в NDJSON: один рецепт в строке."""
+
+    # python manage.py export_recipes --file_name recipes.ndjson
+
+    help = 'Выгружает рецепты с тегами и ингредиентами в файл NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file_name',
+            type=str,
+            default='-',
+            help='имя файла, по умолчанию stdout',
+        )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=1000,
+            help='количество рецептов, читаемых за один запрос',
+        )
+
+    def handle(self, *args, **options):
+        if options['file_name'] == '-':
+            self.export(sys.stdout, options['batch_size'])
+            return
+        with open(options['file_name'], 'w', encoding='utf-8') as file:
+            total = self.export(file, options['batch_size'])
+        self.stdout.write(f'Выгружено рецептов: {total}')
+
+    def export(self, file, batch_size):
+        total = 0
+        for recipe in serialize_recipes(Recipe.objects.all(), batch_size):
+            file.write(json.dumps(recipe, ensure_ascii=False) + '\n')
+            total += 1
+        return total
@@ -0,0 +1,234 @@
+import base64
+import io
+import random
+from itertools import accumulate
+
+from api.cache import CATALOG, RECIPES, USERS, bump_version
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes.models import (Favorites, Ingredient, IngredientIndividual,
+                            Recipe, ShoppingList, Tag)
+from users.models import Follow
+
+User = get_user_model()
+IMAGE_NAME = 'posts/fake.png'
+IMAGE = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAC'
+    'hwGA60e6kgAAAABJRU5ErkJggg=='
+)
+COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F9A62B', '#2D9CDB')
+WORDS = (
+    'пирог', 'суп', 'салат', 'рагу', 'каша', 'омлет', 'запеканка',
+    'с курицей', 'с грибами', 'с овощами', 'по-домашнему', 'быстрый',
+    'летний', 'острый', 'сырный', 'ягодный',
+)
+
+
+def power_law(size, exponent):
+    """Накопленные веса Ципфа: элемент ранга r выбирается как 1 / r**s."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    """Заполняет базу синтетическими данными для нагрузочных замеров.
+
+    Число рецептов у авторов, подписчиков у пользователей и добавлений
+    рецептов в избранное и корзины распределено по степенному закону:
+    немногие популярные объекты получают большую часть связей.
+    """
+
+    # python manage.py generate_fake_data --users 10000 --recipes 100000
+
+    help = 'Создает пользователей, рецепты, подписки, избранное и корзины'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--tags', type=int, default=10,
+            help='сколько тегов должно быть в базе',
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='сколько ингредиентов должно быть в базе',
+        )
+        parser.add_argument(
+            '--follows', type=int, default=None,
+            help='количество подписок, по умолчанию 5 на пользователя',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=None,
+            help='количество добавлений в избранное, по умолчанию '
+                 '3 на рецепт',
+        )
+        parser.add_argument(
+            '--carts', type=int, default=None,
+            help='количество рецептов в корзинах, по умолчанию '
+                 '3 на пользователя',
+        )
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='показатель степенного распределения популярности',
+        )
+        parser.add_argument(
+            '--prefix', type=str, default='fake',
+            help='префикс имен создаваемых пользователей',
+        )
+        parser.add_argument('--batch_size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.exponent = options['exponent']
+        if User.objects.filter(
+                username__startswith=options['prefix']).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {options["prefix"]} уже есть, '
+                f'укажите другой --prefix.'
+            )
+        if not default_storage.exists(IMAGE_NAME):
+            default_storage.save(IMAGE_NAME, ContentFile(IMAGE))
+        with transaction.atomic():
+            tags = self.create_tags(options['tags'])
+            ingredients = self.create_ingredients(options['ingredients'])
+            users = self.create_users(options['users'], options['prefix'])
+            recipes = self.create_recipes(
+                options['recipes'], users, tags, ingredients)
+            self.create_pairs(
+                Follow, 'user', 'following', users, users,
+                options['follows'] or len(users) * 5)
+            self.create_pairs(
+                Favorites, 'user', 'recipe', users, recipes,
+                options['favorites'] or len(recipes) * 3)
+            self.create_pairs(
+                ShoppingList, 'user', 'recipe', users, recipes,
+                options['carts'] or len(users) * 3)
+        # Счетчики и итоги корзин пересчитываются по созданным строкам.
+        call_command('reconcile_counters', stdout=io.StringIO())
+        call_command('rebuild_shopping_list_totals', stdout=io.StringIO())
+        for name in (CATALOG, USERS, RECIPES):
+            bump_version(name)
+
+    def log(self, message):
+        if self.verbosity > 0:
+            self.stdout.write(message)
+
+    def create_tags(self, size):
+        existing = Tag.objects.count()
+        Tag.objects.bulk_create(
+            (
+                Tag(
+                    name=f'Тег {number}',
+                    slug=f'tag{number}',
+                    color=self.random.choice(COLORS),
+                )
+                for number in range(existing, size)
+            ),
+            ignore_conflicts=True,
+        )
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def create_ingredients(self, size):
+        existing = Ingredient.objects.count()
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+                for number in range(existing, size)
+            ),
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        return list(Ingredient.objects.values_list('pk', flat=True))
+
+    def create_users(self, size, prefix):
+        password = make_password(prefix)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name='Имя',
+                    last_name='Фамилия',
+                    password=password,
+                )
+                for number in range(size)
+            ),
+            batch_size=self.batch_size,
+        )
+        users = list(User.objects.filter(
+            username__startswith=prefix).values_list('pk', flat=True))
+        self.random.shuffle(users)
+        self.log(f'Пользователей: {len(users)}, пароль: {prefix}')
+        return users
+
+    def create_recipes(self, size, users, tags, ingredients):
+        self.random.shuffle(ingredients)
+        authors = power_law(len(users), self.exponent)
+        popular = power_law(len(ingredients), self.exponent)
+        created = []
+        for start in range(0, size, self.batch_size):
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    name=' '.join(self.random.sample(WORDS, 2)).capitalize(),
+                    text='Смешать и приготовить.',
+                    cooking_time=self.random.randint(5, 180),
+                    image=IMAGE_NAME,
+                    author_id=author,
+                )
+                for author in self.random.choices(
+                    users, cum_weights=authors,
+                    k=min(self.batch_size, size - start))
+            )
+            IngredientIndividual.objects.bulk_create(
+                IngredientIndividual(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredient,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient in set(self.random.choices(
+                    ingredients, cum_weights=popular,
+                    k=self.random.randint(3, 12)))
+            )
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag)
+                for recipe in recipes
+                for tag in self.random.sample(
+                    tags, min(len(tags), self.random.randint(1, 3)))
+            )
+            created.extend(recipe.pk for recipe in recipes)
+        self.random.shuffle(created)
+        self.log(f'Рецептов: {len(created)}')
+        return created
+
+    def create_pairs(self, model, source, target, sources, targets, size):
+        """Создает связи: источники равновероятны, цели - по популярности."""
+        weights = power_law(len(targets), self.exponent)
+        pairs = set()
+        attempts = 0
+        while len(pairs) < size and attempts < size * 10:
+            count = min(self.batch_size, size - len(pairs))
+            attempts += count
+            pairs.update(
+                pair for pair in zip(
+                    self.random.choices(sources, k=count),
+                    self.random.choices(targets, cum_weights=weights, k=count),
+                )
+                if model is not Follow or pair[0] != pair[1]
+            )
+        model.objects.bulk_create(
+            (
+                model(**{f'{source}_id': first, f'{target}_id': second})
+                for first, second in pairs
+            ),
+            batch_size=self.batch_size,
+        )
+        self.log(f'{model._meta.verbose_name_plural}: {len(pairs)}')
@@ -0,0 +1,146 @@
+import json
+import sys
+from itertools import islice
+
+from api.cache import RECIPES, bump_version
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, F, When
+from recipes.models import Ingredient, IngredientIndividual, Recipe, Tag
+
+User = get_user_model()
+
+
+def read_recipes(file):
+    """Читает рецепты из NDJSON по одному, пропуская пустые строки."""
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as error:
+            raise CommandError(f'Строка {number}: {error}')
+
+
+class Command(BaseCommand):
+    """Загружает рецепты из NDJSON, выгруженного export_recipes.
+
+    Рецепты, ингредиенты и теги записываются пачками через bulk_create.
+    Теги и ингредиенты ищутся по словарям в памяти, авторы - одним
+    запросом на пачку. Изображения передаются ссылками: файлы должны
+    уже лежать в MEDIA_ROOT.
+    """
+
+    # python manage.py import_recipes --file_name recipes.ndjson
+
+    help = 'Загружает рецепты с тегами и ингредиентами из файла NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file_name',
+            type=str,
+            default='-',
+            help='имя файла, по умолчанию stdin',
+        )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=1000,
+            help='количество рецептов в одной пачке',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.tags = dict(Tag.objects.values_list('slug', 'pk'))
+        self.ingredients = {
+            (name, measurement_unit): pk
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'pk', 'name', 'measurement_unit').iterator()
+        }
+        self.created = self.skipped = 0
+        if options['file_name'] == '-':
+            self.load(sys.stdin, options['batch_size'])
+        else:
+            with open(options['file_name'], encoding='utf-8') as file:
+                self.load(file, options['batch_size'])
+        bump_version(RECIPES)
+        self.stdout.write(
+            f'Загружено рецептов: {self.created}, '
+            f'пропущено: {self.skipped}'
+        )
+
+    def load(self, file, batch_size):
+        recipes = read_recipes(file)
+        while batch := list(islice(recipes, batch_size)):
+            self.create_batch(batch)
+            if self.verbosity > 0:
+                self.stdout.write(f'Обработано рецептов: '
+                                  f'{self.created + self.skipped}')
+
+    def resolve(self, data, authors):
+        """Возвращает рецепт, id тегов и количества ингредиентов.
+
+        None, если в строке нет обязательного поля, а автор, тег или
+        ингредиент не найдены.
+        """
+        try:
+            return (
+                Recipe(
+                    name=data['name'],
+                    text=data['text'],
+                    cooking_time=data['cooking_time'],
+                    image=data['image'],
+                    author_id=authors[data['author']],
+                ),
+                {self.tags[slug] for slug in data['tags']},
+                {
+                    self.ingredients[
+                        item['name'], item['measurement_unit']
+                    ]: item['amount']
+                    for item in data['ingredients']
+                },
+            )
+        except (KeyError, TypeError):
+            return None
+
+    @transaction.atomic
+    def create_batch(self, batch):
+        authors = dict(User.objects.filter(
+            username__in={
+                data.get('author') for data in batch
+                if isinstance(data, dict)
+            }
+        ).values_list('username', 'pk'))
+        recipes, relations = [], []
+        for data in batch:
+            resolved = self.resolve(data, authors)
+            if resolved is None or not resolved[1] or not resolved[2]:
+                self.skipped += 1
+                continue
+            recipe, tags, amounts = resolved
+            recipes.append(recipe)
+            relations.append((tags, amounts))
+        if not recipes:
+            return
+        Recipe.objects.bulk_create(recipes)
+        IngredientIndividual.objects.bulk_create(
+            IngredientIndividual(
+                recipe_id=recipe.pk, ingredient_id=ingredient, amount=amount)
+            for recipe, (_, amounts) in zip(recipes, relations)
+            for ingredient, amount in amounts.items()
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag)
+            for recipe, (tags, _) in zip(recipes, relations)
+            for tag in tags
+        )
+        counts = {}
+        for recipe in recipes:
+            counts[recipe.author_id] = counts.get(recipe.author_id, 0) + 1
+        User.objects.filter(pk__in=counts).update(
+            recipes_count=F('recipes_count') + Case(
+                *(When(pk=pk, then=count) for pk, count in counts.items())
+            )
+        )
+        self.created += len(recipes)
@@ -1,14 +1,26 @@
 import csv
+import io
+from itertools import islice
 
+from api.cache import CATALOG, bump_version
 from django.apps import apps
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+MODES = ('insert', 'ignore', 'upsert')
 
 
 class Command(BaseCommand):
-    """Создает объекты моделей из файлов csv."""
+    """Создает объекты моделей из файлов csv.
+
+    Файл читается потоком и записывается пачками по batch_size строк,
+    поэтому расход памяти не зависит от размера файла. На PostgreSQL
+    пачки передаются через COPY во временную таблицу, из которой затем
+    одним запросом переносятся в таблицу модели.
+    """
 
     # python manage.py load_data_from_csv --file_name ingredients.csv
-    # --model_name Ingredient --app_name recipes
+    # --model_name Ingredient --app_name recipes --mode ignore
 
     help = 'Создает объект модели в базу данных из файла .csv'
 
@@ -28,6 +40,24 @@ class Command(BaseCommand):
             type=str,
             help='приложение модели',
         )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=5000,
+            help='количество строк в одной пачке',
+        )
+        parser.add_argument(
+            '--mode',
+            choices=MODES,
+            default='ignore',
+            help='insert - ошибка на дубликатах, ignore - пропускать '
+                 'существующие строки, upsert - обновлять их',
+        )
+        parser.add_argument(
+            '--no_copy',
+            action='store_true',
+            help='не использовать COPY на PostgreSQL',
+        )
 
     def handle(self, *args, **options):
         file_path = 'static/data/' + options['file_name']
@@ -35,16 +65,144 @@ class Command(BaseCommand):
             options['app_name'],
             options['model_name'],
         )
+        self.verbosity = options['verbosity']
         with open(file_path, 'r', encoding='utf-8') as csv_file:
             reader = csv.reader(
                 csv_file,
-                delimiter=','
+                delimiter=',',
+                skipinitialspace=True,
             )
             header = next(reader)
-            objects_of_model = []
-            for row in reader:
-                object_dict = {
-                    key: value for key, value in zip(header, row)
-                }
-                objects_of_model.append(model(**object_dict))
-            model.objects.bulk_create(objects_of_model)
+            fields = [model._meta.get_field(name) for name in header]
+            unique_fields = self.get_unique_fields(model, fields)
+            if options['mode'] == 'upsert' and not unique_fields:
+                raise CommandError(
+                    'Для режима upsert в файле нет полей уникального '
+                    'ограничения модели.'
+                )
+            batches = iter(
+                lambda: list(islice(reader, options['batch_size'])), [])
+            if (connection.vendor == 'postgresql' and not options['no_copy']
+                    and self.can_copy(model, fields)):
+                total = self.copy_batches(
+                    model, fields, unique_fields, batches, options['mode'])
+            else:
+                total = self.create_batches(
+                    model, fields, unique_fields, batches, options['mode'])
+        bump_version(CATALOG)
+        self.stdout.write(f'Загружено строк: {total}')
+
+    def get_unique_fields(self, model, fields):
+        """Поля первого уникального ограничения, целиком есть в файле."""
+        names = {field.name for field in fields}
+        candidates = [
+            constraint.fields
+            for constraint in model._meta.total_unique_constraints
+        ] + [
+            (field.name, ) for field in model._meta.concrete_fields
+            if field.unique and not field.primary_key
+        ]
+        for candidate in candidates:
+            if set(candidate) <= names:
+                return [model._meta.get_field(name) for name in candidate]
+        return []
+
+    def can_copy(self, model, fields):
+        """Через COPY загружаются только файлы со всеми обязательными полями.
+
+        Значения по умолчанию из Python при COPY не подставляются.
+        """
+        return all(
+            field in fields or field.null
+            for field in model._meta.concrete_fields
+            if not field.primary_key
+        )
+
+    def report(self, total):
+        if self.verbosity > 0:
+            self.stdout.write(f'Обработано строк: {total}')
+
+    def create_batches(self, model, fields, unique_fields, batches, mode):
+        options = {}
+        if mode == 'ignore':
+            options['ignore_conflicts'] = True
+        update_fields = [
+            field.name for field in fields if field not in unique_fields]
+        if mode == 'upsert' and update_fields:
+            options.update(
+                update_conflicts=True,
+                unique_fields=[field.name for field in unique_fields],
+                update_fields=update_fields,
+            )
+        elif mode == 'upsert':
+            options['ignore_conflicts'] = True
+        positions = [fields.index(field) for field in unique_fields]
+        total = 0
+        for rows in batches:
+            total += len(rows)
+            if options.get('update_conflicts'):
+                # ON CONFLICT DO UPDATE не меняет строку дважды за запрос,
+                # из повторов в пачке остается последний.
+                rows = {
+                    tuple(row[position] for position in positions): row
+                    for row in rows
+                }.values()
+            model.objects.bulk_create(
+                (
+                    model(**{
+                        field.attname: value
+                        for field, value in zip(fields, row)
+                    })
+                    for row in rows
+                ),
+                **options,
+            )
+            self.report(total)
+        return total
+
+    def copy_batches(self, model, fields, unique_fields, batches, mode):
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        staging = quote(f'{model._meta.db_table}_staging')
+        columns = ', '.join(quote(field.column) for field in fields)
+        select = f'SELECT {columns} FROM {staging}'
+        conflict = ''
+        if mode == 'ignore':
+            conflict = ' ON CONFLICT DO NOTHING'
+        elif mode == 'upsert':
+            unique_columns = ', '.join(
+                quote(field.column) for field in unique_fields)
+            update = ', '.join(
+                f'{quote(field.column)} = EXCLUDED.{quote(field.column)}'
+                for field in fields if field not in unique_fields
+            )
+            if update:
+                select = (
+                    f'SELECT DISTINCT ON ({unique_columns}) {columns} '
+                    f'FROM {staging}'
+                )
+                conflict = (
+                    f' ON CONFLICT ({unique_columns}) DO UPDATE SET {update}')
+            else:
+                conflict = f' ON CONFLICT ({unique_columns}) DO NOTHING'
+        total = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            for rows in batches:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f'COPY {staging} ({columns}) FROM STDIN WITH CSV',
+                    buffer,
+                )
+                total += len(rows)
+                self.report(total)
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) {select}{conflict}')
+            if self.verbosity > 1:
+                self.stdout.write(f'Записано в таблицу: {cursor.rowcount}')
+        return total
@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from recipes.models import ShoppingListTotal
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Пересчитывает итоги списков покупок по исходным строкам."""
+
+    # python manage.py rebuild_shopping_list_totals --dry-run
+
+    help = 'Сверяет и исправляет итоги списков покупок пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='только показать расхождения',
+        )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=1000,
+            help='количество пользователей за один проход',
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(
+            Q(shoppinglist__isnull=False)
+            | Q(shopping_list_totals__isnull=False)
+        ).distinct().order_by('pk').values_list('pk', flat=True)
+        batch_size = options['batch_size']
+        created = updated = deleted = 0
+        last_pk = 0
+        while True:
+            user_ids = list(users.filter(pk__gt=last_pk)[:batch_size])
+            if not user_ids:
+                break
+            last_pk = user_ids[-1]
+            batch = ShoppingListTotal.objects.reconcile(
+                user_ids, dry_run=options['dry_run'])
+            created += batch[0]
+            updated += batch[1]
+            deleted += batch[2]
+        self.stdout.write(
+            f'Создано: {created}, исправлено: {updated}, '
+            f'удалено: {deleted}'
+        )
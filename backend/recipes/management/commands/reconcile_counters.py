@@ -0,0 +1,69 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorites, Recipe
+from users.models import Follow
+
+User = get_user_model()
+
+
+def count_of(model, field):
+    """Подзапрос с числом строк model, ссылающихся на объект по field."""
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+class Command(BaseCommand):
+    """Сверяет денормализованные счетчики с исходными таблицами."""
+
+    # python manage.py reconcile_counters --dry-run
+
+    help = 'Сверяет и исправляет счетчики избранного, рецептов и подписчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='только показать расхождения',
+        )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            default=1000,
+            help='количество объектов в одном обновлении',
+        )
+
+    def handle(self, *args, **options):
+        counters = (
+            (Recipe, 'favorites_count', count_of(Favorites, 'recipe')),
+            (User, 'recipes_count', count_of(Recipe, 'author')),
+            (User, 'followers_count', count_of(Follow, 'following')),
+        )
+        for model, field, expected in counters:
+            fixed = self.reconcile(
+                model, field, expected,
+                options['batch_size'], options['dry_run'])
+            self.stdout.write(
+                f'{model._meta.object_name}.{field}: '
+                f'расхождений {fixed}'
+            )
+
+    def reconcile(self, model, field, expected, batch_size, dry_run):
+        drifted = model.objects.annotate(
+            expected=expected
+        ).exclude(
+            **{field: F('expected')}
+        ).order_by('pk').values_list('pk', 'expected')
+        objects = [
+            model(pk=pk, **{field: value})
+            for pk, value in drifted.iterator()
+        ]
+        if not dry_run:
+            model.objects.bulk_update(objects, [field], batch_size=batch_size)
+        return len(objects)
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.8 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+def delete_duplicates(model):
+    """Удаляет повторы (user, recipe), оставляя первую строку.
+
+    Возвращает затронутые пары.
+    """
+    first = model.objects.values('user', 'recipe').annotate(
+        first_pk=models.Min('pk')).order_by().values('first_pk')
+    duplicates = model.objects.exclude(pk__in=models.Subquery(first))
+    pairs = set(duplicates.values_list('user', 'recipe'))
+    duplicates.delete()
+    return pairs
+
+
+def remove_duplicates(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorites = apps.get_model('recipes', 'Favorites')
+    ShoppingList = apps.get_model('recipes', 'ShoppingList')
+    ShoppingListTotal = apps.get_model('recipes', 'ShoppingListTotal')
+    recipes = {recipe for _, recipe in delete_duplicates(Favorites)}
+    for recipe in recipes:
+        Recipe.objects.filter(pk=recipe).update(
+            favorites_count=Favorites.objects.filter(recipe=recipe).count())
+    users = {user for user, _ in delete_duplicates(ShoppingList)}
+    if not users:
+        return
+    ShoppingListTotal.objects.filter(user__in=users).delete()
+    totals = ShoppingList.objects.filter(user__in=users).values_list(
+        'user', 'recipe__ingredientindividual__ingredient'
+    ).annotate(
+        total_amount=models.Sum('recipe__ingredientindividual__amount')
+    ).order_by()
+    ShoppingListTotal.objects.bulk_create(
+        (
+            ShoppingListTotal(
+                user_id=user, ingredient_id=ingredient, amount=amount)
+            for user, ingredient, amount in totals.iterator()
+            if ingredient is not None
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_favorites_count_recipe_recipe_popular_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+    ]
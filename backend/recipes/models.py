@@ -1,14 +1,22 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
 
 from backend.constants import (MAX_LENGHT_NAME, MAX_VALUE_AMOUNT,
                                MAX_VALUE_TIME, MIN_VALUE)
+from backend.db import CounterFieldsMixin, insert_ignore
 
 User = get_user_model()
 
 
+def change_counter(queryset, field, delta):
+    """Атомарно меняет счетчик field на delta, не опуская его ниже нуля."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: models.F(field) + delta})
+
+
 class Tag(models.Model):
     name = models.CharField(
         'Название',
@@ -92,7 +100,26 @@ class IngredientIndividual(models.Model):
         return f'{self.ingredient.name} в рецепте {self.recipe.name}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        """Добавляет признаки is_favorited и is_in_shopping_cart."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorites.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingList.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+        )
+
+
+class Recipe(CounterFieldsMixin, models.Model):
+    counter_fields = ('favorites_count', )
+
     name = models.CharField(
         'Название',
         max_length=MAX_LENGHT_NAME,
@@ -119,6 +146,15 @@ class Recipe(models.Model):
         'Дата и время создания',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        'Дата и время изменения',
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Добавлений в избранное',
+        default=0,
+        editable=False,
+    )
     tags = models.ManyToManyField(
         Tag, related_name='tags',
     )
@@ -127,15 +163,38 @@ class Recipe(models.Model):
         related_name='ingredients',
     )
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-created_at', 'name')
+        indexes = [
+            models.Index(
+                fields=['-favorites_count', '-created_at'],
+                name='recipe_popular_idx',
+            )
+        ]
 
     def __str__(self):
         return self.name
 
 
+class UserRecipeManager(models.Manager):
+
+    def add(self, user, recipe_ids):
+        """Добавляет рецепты пользователю одним запросом.
+
+        Уже добавленные рецепты пропускаются уникальным ограничением.
+        Возвращает id действительно добавленных рецептов.
+        """
+        return insert_ignore(
+            self.model, ('user', 'recipe'),
+            ((user.pk, recipe_id) for recipe_id in recipe_ids),
+            returning='recipe',
+        )
+
+
 class BaseUserRecipe(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE,
@@ -144,14 +203,21 @@ class BaseUserRecipe(models.Model):
         Recipe, on_delete=models.CASCADE,
     )
 
+    objects = UserRecipeManager()
+
     class Meta:
-        default_related_name = "%(app_label)s_%(class)s_related"
         abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_%(class)s_user_recipe',
+            )
+        ]
 
 
 class Favorites(BaseUserRecipe):
 
-    class Meta():
+    class Meta(BaseUserRecipe.Meta):
         verbose_name = 'избранное'
         verbose_name_plural = 'Избранное'
         ordering = ('user', )
@@ -159,7 +225,164 @@ class Favorites(BaseUserRecipe):
 
 class ShoppingList(BaseUserRecipe):
 
-    class Meta:
+    class Meta(BaseUserRecipe.Meta):
         verbose_name = 'список покупок'
         verbose_name_plural = 'Cписок покупок'
         ordering = ('user', )
+
+
+class ShoppingListTotalManager(models.Manager):
+
+    def change(self, user_ids, amounts):
+        """Прибавляет к итогам пользователей количества {ingredient: delta}.
+
+        Строки пользователей блокируются на время изменения, поэтому
+        параллельные правки одной корзины применяются по очереди.
+        """
+        amounts = {
+            ingredient: delta for ingredient, delta in amounts.items()
+            if delta
+        }
+        user_ids = set(user_ids)
+        if not user_ids or not amounts:
+            return
+        with transaction.atomic():
+            list(User.objects.select_for_update().filter(
+                pk__in=user_ids).values_list('pk'))
+            to_update, to_delete, found = [], [], set()
+            for total in self.filter(
+                user__in=user_ids, ingredient__in=amounts
+            ):
+                found.add((total.user_id, total.ingredient_id))
+                total.amount += amounts[total.ingredient_id]
+                if total.amount > 0:
+                    to_update.append(total)
+                else:
+                    to_delete.append(total.pk)
+            self.bulk_update(to_update, ('amount', ))
+            self.filter(pk__in=to_delete).delete()
+            self.bulk_create(
+                self.model(user_id=user, ingredient_id=ingredient,
+                           amount=delta)
+                for user in user_ids
+                for ingredient, delta in amounts.items()
+                if delta > 0 and (user, ingredient) not in found
+            )
+
+    def add_recipe(self, user, recipe):
+        self.change((user.pk, ), get_recipe_amounts(recipe))
+
+    def remove_recipe(self, user, recipe):
+        self.change(
+            (user.pk, ),
+            {ingredient: -amount for ingredient, amount in
+             get_recipe_amounts(recipe).items()}
+        )
+
+    def reconcile(self, user_ids=None, dry_run=False):
+        """Сверяет итоги с исходными строками и исправляет расхождения.
+
+        Возвращает количество созданных, исправленных и удаленных строк.
+        """
+        expected_rows = ShoppingList.objects.values_list(
+            'user', 'recipe__ingredientindividual__ingredient'
+        ).annotate(
+            total_amount=models.Sum('recipe__ingredientindividual__amount')
+        ).order_by()
+        actual_rows = self.all()
+        if user_ids is not None:
+            expected_rows = expected_rows.filter(user__in=user_ids)
+            actual_rows = actual_rows.filter(user__in=user_ids)
+        expected = {
+            (user, ingredient): amount
+            for user, ingredient, amount in expected_rows.iterator()
+            if ingredient is not None
+        }
+        to_update, to_delete = [], []
+        for total in actual_rows.iterator():
+            amount = expected.pop((total.user_id, total.ingredient_id), 0)
+            if not amount:
+                to_delete.append(total.pk)
+            elif amount != total.amount:
+                total.amount = amount
+                to_update.append(total)
+        to_create = [
+            self.model(user_id=user, ingredient_id=ingredient, amount=amount)
+            for (user, ingredient), amount in expected.items()
+        ]
+        if not dry_run:
+            with transaction.atomic():
+                self.filter(pk__in=to_delete).delete()
+                self.bulk_update(to_update, ('amount', ), batch_size=1000)
+                self.bulk_create(to_create, batch_size=1000)
+        return len(to_create), len(to_update), len(to_delete)
+
+
+def get_recipe_amounts(recipe):
+    return dict(IngredientIndividual.objects.filter(
+        recipe=recipe).values_list('ingredient', 'amount'))
+
+
+def get_recipes_amounts(recipes):
+    """Суммарные количества ингредиентов нескольких рецептов."""
+    return dict(IngredientIndividual.objects.filter(
+        recipe__in=recipes
+    ).values_list('ingredient').annotate(
+        total_amount=models.Sum('amount')
+    ).order_by())
+
+
+class ShoppingListTotal(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_list_totals',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_totals',
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingListTotalManager()
+
+    class Meta:
+        verbose_name = 'итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        ordering = ('user', 'ingredient')
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'user',
+                    'ingredient',
+                ],
+                name='unique_shopping_list_total'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} для {self.user}: {self.amount}'
+
+
+def get_cart_users(recipes):
+    """Пользователи, у которых рецепты recipes лежат в корзине."""
+    return set(ShoppingList.objects.filter(
+        recipe__in=recipes).values_list('user', flat=True))
+
+
+@transaction.atomic
+def delete_user(user):
+    """Удаляет пользователя вместе со следами в счетчиках и корзинах.
+
+    Каскадное удаление обходит счетчики подписчиков и избранного, а
+    рецепты автора пропадают из корзин других пользователей.
+    """
+    change_counter(
+        User.objects.filter(followers__user=user), 'followers_count', -1)
+    change_counter(
+        Recipe.objects.filter(favorites__user=user).exclude(author=user),
+        'favorites_count', -1)
+    users = get_cart_users(user.recipes.all()) - {user.pk}
+    user.delete()
+    ShoppingListTotal.objects.reconcile(users)
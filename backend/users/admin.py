@@ -1,12 +1,20 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
+from recipes.models import delete_user
 
 User = get_user_model()
 
 
 class UserAdmin(UserAdmin):
-    list_filter = ('first_name', 'email')
+    list_filter = ('is_staff', 'is_active')
+
+    def delete_model(self, request, obj):
+        delete_user(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            delete_user(user)
 
 
 admin.site.register(User, UserAdmin)
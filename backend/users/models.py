@@ -4,9 +4,11 @@ from django.db import models
 from django.db.models import F, Q
 
 from backend.constants import MAX_lENGTH_USER
+from backend.db import CounterFieldsMixin
 
 
-class CustomUser(AbstractUser):
+class CustomUser(CounterFieldsMixin, AbstractUser):
+    counter_fields = ('recipes_count', 'followers_count')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
@@ -19,6 +21,16 @@ class CustomUser(AbstractUser):
             'unique': 'A user with that email already exists.'
         },
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Пользователь'